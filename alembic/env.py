@@ -11,12 +11,15 @@ config = context.config
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
-fileConfig(config.config_file_name)
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
 
 # add your model's MetaData object here
 # for 'autogenerate' support
-from libup import model  # noqa
+from libup import db, model  # noqa
 target_metadata = model.Base.metadata
+# Use the same database as everything else, instead of alembic.ini's
+config.set_main_option("sqlalchemy.url", db.sql_uri())
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -42,7 +45,9 @@ def run_migrations_offline():
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
-        compare_type=True
+        compare_type=True,
+        # SQLite can't ALTER most things, so recreate tables instead
+        render_as_batch=db.is_sqlite(url),
     )
 
     with context.begin_transaction():
@@ -56,6 +61,12 @@ def run_migrations_online():
     and associate a connection with the context.
 
     """
+    # db.create_schema() passes in its own connection
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        run_migrations(connection)
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section),
         prefix="sqlalchemy.",
@@ -63,13 +74,19 @@ def run_migrations_online():
     )
 
     with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata,
-            compare_type=True
-        )
+        run_migrations(connection)
+
 
-        with context.begin_transaction():
-            context.run_migrations()
+def run_migrations(connection):
+    context.configure(
+        connection=connection, target_metadata=target_metadata,
+        compare_type=True,
+        # SQLite can't ALTER most things, so recreate tables instead
+        render_as_batch=connection.dialect.name == "sqlite",
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
 
 
 if context.is_offline_mode():
@@ -0,0 +1,53 @@
+"""
+add parsed version columns to dependencies
+
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Revision ID: 5e2f9c1d7a43
+Revises: 93844b6719eb
+Create Date: 2022-02-16 19:42:10.118230
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '5e2f9c1d7a43'
+down_revision = '93844b6719eb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('dependencies', sa.Column('version_major', sa.Integer(), nullable=True))
+    op.add_column('dependencies', sa.Column('version_minor', sa.Integer(), nullable=True))
+    op.add_column('dependencies', sa.Column('version_patch', sa.Integer(), nullable=True))
+    op.add_column('dependencies', sa.Column('version_prerelease', sa.Boolean(), nullable=True))
+    op.add_column('dependencies', sa.Column('version_kind', sa.String(length=12), nullable=True))
+    # The wider index still covers (name, manager) lookups
+    op.create_index('ix_dependencies_name_manager_version', 'dependencies',
+                    ['name', 'manager', 'version_major', 'version_minor', 'version_patch'])
+    op.drop_index('ix_dependencies_name_manager', table_name='dependencies')
+
+
+def downgrade():
+    op.create_index('ix_dependencies_name_manager', 'dependencies', ['name', 'manager'])
+    op.drop_index('ix_dependencies_name_manager_version', table_name='dependencies')
+    op.drop_column('dependencies', 'version_kind')
+    op.drop_column('dependencies', 'version_prerelease')
+    op.drop_column('dependencies', 'version_patch')
+    op.drop_column('dependencies', 'version_minor')
+    op.drop_column('dependencies', 'version_major')
@@ -0,0 +1,60 @@
+"""
+add indexes for hot queries
+
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Revision ID: 60d1902c5b9b
+Revises: 4f87a173a7d8
+Create Date: 2022-02-07 18:12:40.120934
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '60d1902c5b9b'
+down_revision = '4f87a173a7d8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_dependencies_name_manager', 'dependencies', ['name', 'manager'])
+    # The repo_id indexes supersede the implicit ones MariaDB created for
+    # the foreign keys (SQLite doesn't create any)
+    op.create_index('ix_dependencies_repo_id', 'dependencies', ['repo_id'])
+    op.create_index('ix_repositories_name_branch', 'repositories', ['name', 'branch'])
+    op.create_index('ix_repositories_branch_name', 'repositories', ['branch', 'name'])
+    op.create_index('ix_logs_repo_id_id', 'logs', ['repo_id', 'id'])
+    op.create_index('ix_advisories_repo_id', 'advisories', ['repo_id'])
+    op.create_index('ix_upstreams_manager_name', 'upstreams', ['manager', 'name'])
+
+
+def drop_fk_index(name, table):
+    if op.get_bind().dialect.name == 'mysql':
+        # MariaDB refuses to drop the only index backing a foreign key,
+        # so put back the implicit one first
+        op.create_index('repo_id', table, ['repo_id'])
+    op.drop_index(name, table_name=table)
+
+
+def downgrade():
+    op.drop_index('ix_upstreams_manager_name', table_name='upstreams')
+    drop_fk_index('ix_advisories_repo_id', 'advisories')
+    drop_fk_index('ix_logs_repo_id_id', 'logs')
+    op.drop_index('ix_repositories_branch_name', table_name='repositories')
+    op.drop_index('ix_repositories_name_branch', table_name='repositories')
+    drop_fk_index('ix_dependencies_repo_id', 'dependencies')
+    op.drop_index('ix_dependencies_name_manager', table_name='dependencies')
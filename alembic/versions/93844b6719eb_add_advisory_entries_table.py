@@ -0,0 +1,52 @@
+"""
+add advisory_entries table
+
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Revision ID: 93844b6719eb
+Revises: ca60dfc19067
+Create Date: 2022-02-14 22:06:51.902441
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '93844b6719eb'
+down_revision = 'ca60dfc19067'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'advisory_entries',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('repo_id', sa.Integer(), nullable=True),
+        sa.Column('manager', sa.String(length=10), nullable=False),
+        sa.Column('advisory_id', sa.String(length=150), nullable=False),
+        sa.Column('package', sa.String(length=150), nullable=False),
+        sa.Column('severity', sa.String(length=10), nullable=True),
+        sa.Column('info', sa.BLOB(), nullable=False),
+        sa.ForeignKeyConstraint(['repo_id'], ['repositories.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_advisory_entries_manager_advisory_id', 'advisory_entries', ['manager', 'advisory_id'])
+    op.create_index('ix_advisory_entries_repo_id', 'advisory_entries', ['repo_id'])
+
+
+def downgrade():
+    op.drop_table('advisory_entries')
@@ -0,0 +1,44 @@
+"""
+track pushed and compacted logs
+
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Revision ID: b81d4e6a2f90
+Revises: 5e2f9c1d7a43
+Create Date: 2022-02-18 21:05:33.402871
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'b81d4e6a2f90'
+down_revision = '5e2f9c1d7a43'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing logs are left as NULL, we don't know whether they were pushed
+    op.add_column('logs', sa.Column('is_pushed', sa.Boolean(), nullable=True))
+    op.add_column('logs', sa.Column('is_compacted', sa.Boolean(), nullable=False, server_default=sa.false()))
+    op.create_index('ix_logs_text_sha256', 'logs', ['text_sha256'])
+
+
+def downgrade():
+    op.drop_index('ix_logs_text_sha256', table_name='logs')
+    op.drop_column('logs', 'is_compacted')
+    op.drop_column('logs', 'is_pushed')
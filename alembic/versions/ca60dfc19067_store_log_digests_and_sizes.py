@@ -0,0 +1,47 @@
+"""
+store log digests and sizes
+
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Revision ID: ca60dfc19067
+Revises: 60d1902c5b9b
+Create Date: 2022-02-12 20:41:03.518337
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'ca60dfc19067'
+down_revision = '60d1902c5b9b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('logs', sa.Column('text_sha256', sa.String(length=64), nullable=True))
+    op.add_column('logs', sa.Column('text_size', sa.Integer(), nullable=True))
+    op.add_column('logs', sa.Column('patch_sha256', sa.String(length=64), nullable=True))
+    op.add_column('logs', sa.Column('patch_size', sa.Integer(), nullable=True))
+    op.create_index('ix_logs_patch_sha256', 'logs', ['patch_sha256'])
+
+
+def downgrade():
+    op.drop_index('ix_logs_patch_sha256', table_name='logs')
+    op.drop_column('logs', 'patch_size')
+    op.drop_column('logs', 'patch_sha256')
+    op.drop_column('logs', 'text_size')
+    op.drop_column('logs', 'text_sha256')
@@ -0,0 +1,55 @@
+"""
+add dependency_changes table
+
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Revision ID: e3a7c05b9d12
+Revises: b81d4e6a2f90
+Create Date: 2022-02-19 17:48:02.611904
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'e3a7c05b9d12'
+down_revision = 'b81d4e6a2f90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'dependency_changes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('repo_id', sa.Integer(), nullable=True),
+        sa.Column('name', sa.String(length=80), nullable=False),
+        sa.Column('manager', sa.String(length=20), nullable=False),
+        sa.Column('mode', sa.String(length=4), nullable=False),
+        sa.Column('old', sa.String(length=150), nullable=True),
+        sa.Column('new', sa.String(length=150), nullable=True),
+        sa.Column('time', sa.String(length=15), nullable=False),
+        sa.Column('log_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['repo_id'], ['repositories.id'], ),
+        sa.ForeignKeyConstraint(['log_id'], ['logs.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_dependency_changes_manager_name_time', 'dependency_changes', ['manager', 'name', 'time'])
+    op.create_index('ix_dependency_changes_repo_id_time', 'dependency_changes', ['repo_id', 'time'])
+
+
+def downgrade():
+    op.drop_table('dependency_changes')
@@ -0,0 +1,78 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import hashlib
+from typing import List
+
+
+def parse(manager: str, report: dict) -> List[dict]:
+    """normalize an audit report into one dict per advisory"""
+    if manager == "npm":
+        entries = parse_npm(report)
+    elif manager == "composer":
+        entries = parse_composer(report)
+    else:
+        # No audit tooling for this manager yet
+        return []
+    # The same advisory can be reported through multiple paths
+    unique = {}
+    for entry in entries:
+        unique[entry["advisory_id"]] = entry
+    return list(unique.values())
+
+
+def parse_npm(report: dict) -> List[dict]:
+    if 'error' in report:
+        return []
+    if report.get("auditReportVersion") != 2:
+        # old npm v6 report
+        return []
+    entries = []
+    for info in report["vulnerabilities"].values():
+        for via in info["via"]:
+            if isinstance(via, dict):
+                entries.append({
+                    "advisory_id": str(via["source"]),
+                    "package": via["name"],
+                    "severity": via["severity"],
+                    "info": via,
+                })
+    return entries
+
+
+def composer_key(package: str, advisory: dict) -> str:
+    """A unique ID for each advisory"""
+    if advisory.get('cve'):
+        # CVE should be unique
+        return advisory['cve']
+    else:
+        # Hopefully this combo is unique enough, hash it to fit in the column
+        combo = f"{package}-{advisory['title']}-{advisory['link']}"
+        return "sha1:" + hashlib.sha1(combo.encode()).hexdigest()
+
+
+def parse_composer(report: dict) -> List[dict]:
+    entries = []
+    for package, details in report.items():
+        for advisory in details['advisories']:
+            entries.append({
+                "advisory_id": composer_key(package, advisory),
+                "package": package,
+                "severity": None,
+                "info": advisory,
+            })
+    return entries
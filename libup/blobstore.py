@@ -0,0 +1,147 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from abc import ABC, abstractmethod
+import hashlib
+import os
+from pathlib import Path
+import tempfile
+from typing import Optional
+
+from . import config, utils
+
+# Marks a database value that's a reference into the blob store. 0xff
+# never appears in UTF-8, so no text stored inline can start with it.
+PREFIX = b'\xffb:'
+
+
+class BlobStore(ABC):
+    """
+    Content-addressed storage, keyed by the sha256 of the uncompressed
+    text. Implementations only need put/get/exists/delete on opaque keys,
+    so object stores (Swift, S3) fit just as well as a filesystem.
+    """
+
+    @abstractmethod
+    def put(self, digest: str, data: bytes):
+        pass
+
+    @abstractmethod
+    def get(self, digest: str) -> bytes:
+        pass
+
+    @abstractmethod
+    def exists(self, digest: str) -> bool:
+        pass
+
+    @abstractmethod
+    def delete(self, digest: str):
+        pass
+
+    @abstractmethod
+    def last_stored(self, digest: str) -> Optional[float]:
+        """unix time of the last put() of the blob, None if it doesn't exist"""
+
+
+class FilesystemBlobStore(BlobStore):
+    """blobs stored as files under root/ab/cd/abcd..."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def put(self, digest: str, data: bytes):
+        path = self.path(digest)
+        if path.exists():
+            # Identical content, already stored. Bump the mtime so
+            # sweep_blobs() knows it's in use again.
+            try:
+                os.utime(path)
+                return
+            except FileNotFoundError:
+                # Deleted in the meantime, store it again
+                pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and rename, so readers never see a partial blob
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, digest: str) -> bytes:
+        return self.path(digest).read_bytes()
+
+    def exists(self, digest: str) -> bool:
+        return self.path(digest).exists()
+
+    def delete(self, digest: str):
+        try:
+            self.path(digest).unlink()
+        except FileNotFoundError:
+            pass
+
+    def last_stored(self, digest: str) -> Optional[float]:
+        try:
+            return self.path(digest).stat().st_mtime
+        except FileNotFoundError:
+            return None
+
+
+def get_store() -> Optional[BlobStore]:
+    """the configured blob store, if any"""
+    root = config.private().get("blob_store")
+    if root is None:
+        return None
+    return FilesystemBlobStore(root)
+
+
+def digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def is_reference(data: bytes) -> bool:
+    return data.startswith(PREFIX)
+
+
+def store(text: str, key: Optional[str] = None) -> bytes:
+    """
+    Compress and store the text, returning what should be saved in the
+    database: a reference if a blob store is configured, otherwise the
+    (possibly compressed) text itself.
+
+    :param key: digest(text), if the caller already computed it
+    """
+    data = utils.maybe_compress(text)
+    blobs = get_store()
+    if blobs is None:
+        return data
+    if key is None:
+        key = digest(text)
+    blobs.put(key, data)
+    return PREFIX + key.encode()
+
+
+def load(data: bytes) -> str:
+    """inverse of store()"""
+    if is_reference(data):
+        blobs = get_store()
+        if blobs is None:
+            raise RuntimeError("Found a blob reference, but no blob_store is configured")
+        data = blobs.get(data[len(PREFIX):].decode())
+    return utils.maybe_decompress(data)
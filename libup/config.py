@@ -19,13 +19,30 @@ import json
 from pathlib import Path
 import os
 import subprocess
+import threading
+import time
 import toml
+from typing import Any, Dict, Tuple
 
 from . import BRANCHES, CONFIG_REPO, MONITORING, RELEASES, REPOSITORIES
 
+# Minimum number of seconds between two `git pull`s of the config repo
+PULL_INTERVAL = 30
+_pull_lock = threading.Lock()
+# time.monotonic() of the last pull, 0 if there hasn't been one
+_last_pull = 0.0
+_cache_lock = threading.Lock()
+# path -> ((mtime, size), parsed contents)
+_cache: Dict[str, Tuple[tuple, Any]] = {}
+
 
 def ensure(pull=False):
-    """ensure the config repo exists"""
+    """
+    ensure the config repo exists. Pulls are coalesced: callers that
+    ask for one while another is running wait for it and share its
+    result, and there's at most one every PULL_INTERVAL seconds.
+    """
+    global _last_pull
     if not os.path.exists(RELEASES):
         subprocess.check_call([
             'git', 'clone',
@@ -33,14 +50,35 @@ def ensure(pull=False):
             CONFIG_REPO
         ], cwd=os.path.dirname(CONFIG_REPO))
     elif pull:
-        subprocess.check_call(['git', 'pull'], cwd=CONFIG_REPO)
+        with _pull_lock:
+            if _last_pull and time.monotonic() - _last_pull < PULL_INTERVAL:
+                # Recent enough
+                return
+            subprocess.check_call(['git', 'pull'], cwd=CONFIG_REPO)
+            _last_pull = time.monotonic()
+
+
+def _load(path: str):
+    """
+    parsed contents of a JSON file, reused for as long as the file is
+    unchanged. Callers must not modify what's returned.
+    """
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        cached = _cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    data = json.loads(Path(path).read_text())
+    with _cache_lock:
+        _cache[path] = (key, data)
+    return data
 
 
 def releases(pull=False) -> dict:
     ensure(pull=pull)
 
-    with open(RELEASES) as f:
-        data = json.load(f)
+    data = _load(RELEASES)
     assert data['version'] == 2
     return data
 
@@ -48,22 +86,19 @@ def releases(pull=False) -> dict:
 def repositories(pull=False) -> dict:
     ensure(pull=pull)
 
-    with open(REPOSITORIES) as f:
-        return json.load(f)
+    return _load(REPOSITORIES)
 
 
 def monitoring(pull=False) -> dict:
     ensure(pull=pull)
 
-    text = Path(MONITORING).read_text()
-    return json.loads(text)
+    return _load(MONITORING)
 
 
 def branches(pull=False) -> list:
     ensure(pull=pull)
 
-    text = Path(BRANCHES).read_text()
-    return json.loads(text)['list']
+    return _load(BRANCHES)['list']
 
 
 def git_branches(pull=False) -> list:
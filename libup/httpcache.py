@@ -0,0 +1,153 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import functools
+import json
+import os
+import requests
+import sqlite3
+import threading
+import time
+from typing import Callable, Optional
+
+from . import CACHE, session
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    -- What parse() returned, as JSON
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    -- Unix timestamps
+    fetched REAL NOT NULL,
+    accessed REAL NOT NULL
+)
+"""
+
+
+class HTTPCache:
+    """
+    On-disk cache of parsed HTTP responses, keyed by URL.
+
+    Entries younger than ``ttl`` seconds are used as is, older ones are
+    revalidated with a conditional request, so an unchanged resource only
+    costs a 304 and no parsing. Once the cache is bigger than
+    ``max_bytes``, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path: str, ttl=600, max_bytes=64 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        # All access to the connection is serialized by the lock
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(SCHEMA)
+
+    # url is the cache key in the following, see get()
+
+    def _lookup(self, url: str) -> Optional[tuple]:
+        with self.lock:
+            return self.conn.execute(
+                "SELECT etag, last_modified, value, fetched FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+
+    def _touch(self, url: str, fetched: Optional[float] = None):
+        now = time.time()
+        with self.lock:
+            if fetched is None:
+                self.conn.execute("UPDATE responses SET accessed = ? WHERE url = ?", (now, url))
+            else:
+                self.conn.execute("UPDATE responses SET accessed = ?, fetched = ? WHERE url = ?",
+                                  (now, fetched, url))
+
+    def _store(self, url: str, resp: requests.Response, value):
+        data = json.dumps(value)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "REPLACE INTO responses (url, etag, last_modified, value, size, fetched, accessed) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, resp.headers.get("ETag"), resp.headers.get("Last-Modified"), data,
+                 len(data), now, now)
+            )
+        self.evict()
+
+    def evict(self):
+        """drop the least recently used entries until we're under 90% of max_bytes"""
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            budget = self.max_bytes * 0.9
+            evict = []
+            for url, size in self.conn.execute("SELECT url, size FROM responses ORDER BY accessed"):
+                if total <= budget:
+                    break
+                evict.append((url,))
+                total -= size
+            self.conn.executemany("DELETE FROM responses WHERE url = ?", evict)
+
+    def get(self, url: str, parse: Callable[[requests.Response], object], headers=None,
+            wait: Optional[Callable[[], None]] = None, stream=False):
+        """
+        parse(response) for the URL, from the cache if possible. Only
+        successful responses are cached.
+
+        :param wait: called before actually making a request, e.g. for rate limiting
+        :param stream: don't download the body upfront, parse() can read
+          as much of it as it needs, the rest is never downloaded
+        """
+        headers = dict(headers or {})
+        key = url
+        if "Accept" in headers:
+            # Different representations of the same URL
+            key += " " + headers["Accept"]
+        cached = self._lookup(key)
+        if cached is not None:
+            etag, last_modified, value, fetched = cached
+            if time.time() - fetched < self.ttl:
+                self._touch(key)
+                return json.loads(value)
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+        if wait is not None:
+            wait()
+        with session.get(url, headers=headers, stream=stream) as resp:
+            if cached is not None and resp.status_code == 304:
+                self._touch(key, fetched=time.time())
+                return json.loads(cached[2])
+            parsed = parse(resp)
+        if resp.ok:
+            self._store(key, resp, parsed)
+        return parsed
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM responses")
+
+
+@functools.lru_cache()
+def get_cache() -> HTTPCache:
+    """the process-wide cache, stored under CACHE"""
+    os.makedirs(CACHE, exist_ok=True)
+    return HTTPCache(os.path.join(CACHE, "http.sqlite3"))
@@ -0,0 +1,155 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import codecs
+import json
+import re
+from typing import Collection, Iterable
+
+# Characters that matter when skipping over a value
+_STRUCTURE = re.compile(r'["{}\[\],]')
+_STRING = re.compile(r'["\\]')
+_NUMBER = set('0123456789.eE+-')
+_decoder = json.JSONDecoder()
+
+
+class _Buffer:
+    """decoded text from the chunks read so far, minus what was consumed"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.chunks = iter(chunks)
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.data = ''
+        self.pos = 0
+
+    def more(self) -> bool:
+        """read another chunk, False if there are none left"""
+        chunk = next(self.chunks, None)
+        if chunk is None:
+            return False
+        # Drop what we already consumed, so memory use stays bounded
+        self.data = self.data[self.pos:] + self.utf8.decode(chunk)
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """next non-whitespace character, or '' at the end"""
+        while True:
+            rest = self.data[self.pos:]
+            self.pos += len(rest) - len(rest.lstrip())
+            if self.pos < len(self.data):
+                return self.data[self.pos]
+            if not self.more():
+                return ''
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}")
+        self.pos += 1
+
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.data, self.pos)
+            except json.JSONDecodeError:
+                if not self.more():
+                    raise
+                continue
+            # A number at the end (e.g. "12." or "1e") might continue in the next chunk
+            if (end == len(self.data) or self.data[end] in _NUMBER) and self.more():
+                continue
+            self.pos = end
+            return value
+
+    def skip_value(self):
+        """move past the next value without decoding it"""
+        self.peek()
+        depth = 0
+        in_string = False
+        i = self.pos
+        while True:
+            pattern = _STRING if in_string else _STRUCTURE
+            match = pattern.search(self.data, i)
+            if match is None:
+                # Nothing we skipped so far is needed anymore
+                self.pos = len(self.data)
+                if not self.more():
+                    raise ValueError("Truncated JSON")
+                i = self.pos
+                continue
+            char = match.group()
+            i = match.end()
+            if in_string:
+                if char == '\\':
+                    if i == len(self.data):
+                        # The escaped character is in the next chunk
+                        self.pos = i
+                        if not self.more():
+                            raise ValueError("Truncated JSON")
+                        i = self.pos
+                    i += 1
+                else:
+                    in_string = False
+                    if depth == 0:
+                        self.pos = i
+                        return
+            elif char == '"':
+                in_string = True
+            elif char in '{[':
+                depth += 1
+            elif char in '}]':
+                if depth == 0:
+                    # End of the parent, a scalar ended right before it
+                    self.pos = i - 1
+                    return
+                depth -= 1
+                if depth == 0:
+                    self.pos = i
+                    return
+            elif depth == 0:
+                # "," after a scalar
+                self.pos = i - 1
+                return
+
+
+def read_keys(chunks: Iterable[bytes], keys: Collection[str]) -> dict:
+    """
+    Read the given top-level keys of a JSON object from a stream of
+    chunks, e.g. requests' iter_content(). Stops reading as soon as all
+    of them were found, other values are skipped without being decoded.
+    Keys that aren't present are left out of the result.
+    """
+    buf = _Buffer(chunks)
+    found: dict = {}
+    buf.expect('{')
+    while len(found) < len(keys):
+        char = buf.peek()
+        if char == '}':
+            break
+        if char == ',':
+            buf.pos += 1
+            continue
+        key = buf.decode_value()
+        if not isinstance(key, str):
+            raise ValueError(f"Expected a key at offset {buf.pos}")
+        buf.expect(':')
+        if key in keys:
+            found[key] = buf.decode_value()
+        else:
+            buf.skip_value()
+    return found
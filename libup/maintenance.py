@@ -0,0 +1,317 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+from sqlalchemy import and_, bindparam, or_
+from sqlalchemy.orm import undefer_group
+import time
+
+from . import blobstore, db, utils, versions
+from .model import Advisories, Dependency, Log, Repository
+
+
+def init_db() -> bool:
+    """create the schema in a new (e.g. SQLite) database"""
+    created = db.create_schema(db.get_engine())
+    if created:
+        print(f"Created tables in {db.get_engine().url!r}")
+    else:
+        print("Database already has tables, use alembic to upgrade it")
+    return created
+
+
+def migrate_blobs(session, batch_size=100) -> int:
+    """move log text and patches stored in the database into the blob store"""
+    if blobstore.get_store() is None:
+        raise RuntimeError("No blob_store is configured")
+    last_id = 0
+    migrated = 0
+    while True:
+        # Compacted logs have nothing to move, and set_text() would
+        # overwrite the digest they kept
+        logs = session.query(Log)\
+            .filter(Log.id > last_id, Log.is_compacted.is_(False))\
+            .options(undefer_group("blobs"))\
+            .order_by(Log.id)\
+            .limit(batch_size).all()
+        if not logs:
+            break
+        for log in logs:
+            last_id = log.id
+            changed = False
+            if not blobstore.is_reference(log.text):
+                log.set_text(log.get_text())
+                changed = True
+            if log.patch is not None and not blobstore.is_reference(log.patch):
+                log.set_patch(log.get_patch())
+                changed = True
+            if changed:
+                migrated += 1
+        session.commit()
+        # Don't keep every log we've looked at in the identity map
+        session.expunge_all()
+        print(f"Migrated {migrated} logs (up to log #{last_id})")
+
+    return migrated
+
+
+def backfill_digests(session, batch_size=100) -> int:
+    """store digests and sizes for logs from before they were computed at ingest"""
+    last_id = 0
+    filled = 0
+    while True:
+        logs = session.query(Log)\
+            .filter(Log.id > last_id, Log.text_sha256.is_(None))\
+            .options(undefer_group("blobs"))\
+            .order_by(Log.id)\
+            .limit(batch_size).all()
+        if not logs:
+            break
+        for log in logs:
+            last_id = log.id
+            text = log.get_text()
+            log.text_sha256 = blobstore.digest(text)
+            log.text_size = len(text.encode())
+            patch = log.get_patch()
+            if patch is not None:
+                log.patch_sha256 = blobstore.digest(patch)
+                log.patch_size = len(patch.encode())
+            filled += 1
+        session.commit()
+        session.expunge_all()
+        print(f"Backfilled {filled} logs (up to log #{last_id})")
+
+    return filled
+
+
+def backfill_advisories(session) -> int:
+    """build the normalized advisory rows from the stored audit reports"""
+    count = 0
+    for advisories in session.query(Advisories).all():
+        db.sync_advisories(session, advisories.repo_id, advisories.manager, advisories.get_data())
+        count += 1
+    session.commit()
+    print(f"Normalized {count} audit reports")
+    return count
+
+
+def backfill_versions(session, batch_size=1000) -> int:
+    """fill in the parsed version columns for existing dependencies"""
+    table = Dependency.__table__
+    last_id = 0
+    filled = 0
+    while True:
+        rows = session.query(Dependency.id, Dependency.version)\
+            .filter(Dependency.id > last_id)\
+            .order_by(Dependency.id)\
+            .limit(batch_size).all()
+        if not rows:
+            break
+        updates = []
+        for row in rows:
+            last_id = row.id
+            update = {"dep_id": row.id}
+            for column, value in versions.columns(row.version).items():
+                update[f"new_{column}"] = value
+            updates.append(update)
+        session.execute(
+            table.update()
+            .where(table.c.id == bindparam("dep_id"))
+            .values(**{column: bindparam(f"new_{column}") for column in versions.COLUMNS}),
+            updates
+        )
+        session.commit()
+        filled += len(updates)
+        print(f"Backfilled {filled} dependencies (up to #{last_id})")
+
+    return filled
+
+
+def _compact(session, rows):
+    table = Log.__table__
+    session.execute(
+        table.update()
+        .where(table.c.id.in_([row.id for row in rows]))
+        .values(text=b'', patch=None, is_compacted=True)
+    )
+    session.commit()
+
+
+def retention(session, keep=10, batch_size=500, sleep=1.0, dry_run=False) -> dict:
+    """
+    Compact logs down to their metadata and digests, except for the last
+    ``keep`` runs of each repository and runs whose patch was pushed (or,
+    for runs from before that was tracked, that have a patch at all).
+
+    Logs are compacted in batches of ``batch_size``, sleeping ``sleep``
+    seconds in between to not hog the database. Logs without digests are
+    skipped, run backfill-digests first. Blobs are left in place, see
+    sweep_blobs().
+    """
+    if keep < 1:
+        raise ValueError("Need to keep at least one log per repository")
+    report = {'logs': 0, 'bytes': 0}
+    compactable = or_(
+        Log.is_pushed.is_(False),
+        and_(Log.is_pushed.is_(None), Log.patch.is_(None)),
+    )
+    pending: list = []
+
+    def flush():
+        report['logs'] += len(pending)
+        # Uncompressed, the columns might only hold a blob reference
+        report['bytes'] += sum((row.text_size or 0) + (row.patch_size or 0) for row in pending)
+        if not dry_run:
+            _compact(session, pending)
+            time.sleep(sleep)
+        print(f"{'Would compact' if dry_run else 'Compacted'} {report['logs']} logs so far")
+        pending.clear()
+
+    repo_ids = [row.id for row in session.query(Repository.id).order_by(Repository.id)]
+    for repo_id in repo_ids:
+        # id of the oldest log we want to keep regardless
+        cutoff = session.query(Log.id)\
+            .filter(Log.repo_id == repo_id)\
+            .order_by(Log.id.desc())\
+            .offset(keep - 1).limit(1).scalar()
+        if cutoff is None:
+            continue
+        rows = session.query(Log.id, Log.text_size, Log.patch_size)\
+            .filter(Log.repo_id == repo_id, Log.id < cutoff, Log.is_compacted.is_(False),
+                    Log.text_sha256.isnot(None), compactable)\
+            .all()
+        for row in rows:
+            pending.append(row)
+            if len(pending) >= batch_size:
+                flush()
+    if pending:
+        flush()
+
+    print(f"{'Would compact' if dry_run else 'Compacted'} {report['logs']} logs "
+          f"({report['bytes']} bytes of text and patches)")
+    return report
+
+
+def sweep_blobs(session, grace=3600, batch_size=1000) -> int:
+    """
+    Delete the blobs of compacted logs that no other log refers to.
+
+    This runs separately from retention(), as a run storing identical
+    text reuses the existing blob and only commits its log later. So a
+    blob is only deleted if it also wasn't stored (or reused) in the
+    last ``grace`` seconds.
+    """
+    blobs = blobstore.get_store()
+    if blobs is None:
+        raise RuntimeError("No blob_store is configured")
+    last_id = 0
+    deleted = 0
+    while True:
+        # Start a new transaction, so we see logs committed in the meantime
+        session.commit()
+        rows = session.query(Log.id, Log.text_sha256, Log.patch_sha256)\
+            .filter(Log.id > last_id, Log.is_compacted.is_(True))\
+            .order_by(Log.id)\
+            .limit(batch_size).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        digests = {row.text_sha256 for row in rows} | {row.patch_sha256 for row in rows if row.patch_sha256}
+        # Identical text is stored once, so skip blobs other logs still refer to
+        referenced = {row[0] for row in session.query(Log.text_sha256).filter(
+            Log.is_compacted.is_(False), Log.text_sha256.in_(digests))}
+        referenced |= {row[0] for row in session.query(Log.patch_sha256).filter(
+            Log.is_compacted.is_(False), Log.patch_sha256.in_(digests))}
+        for digest in digests - referenced:
+            stored = blobs.last_stored(digest)
+            if stored is None or time.time() - stored < grace:
+                continue
+            blobs.delete(digest)
+            deleted += 1
+        print(f"Deleted {deleted} blobs (up to log #{last_id})")
+
+    return deleted
+
+
+def train_zstd(session, samples=2000, size=112640) -> int:
+    """train a zstd dictionary on the most recent logs and start using it"""
+    if utils.zstandard is None:
+        raise RuntimeError("zstandard is not installed")
+    logs = session.query(Log)\
+        .filter(Log.is_compacted.is_(False))\
+        .options(undefer_group("blobs"))\
+        .order_by(Log.id.desc())\
+        .limit(samples).all()
+    data = []
+    for log in logs:
+        data.append(log.get_text().encode())
+        patch = log.get_patch()
+        if patch:
+            data.append(patch.encode())
+    dictionary = utils.zstandard.train_dictionary(size, data)
+    dict_id = utils.save_zstd_dictionary(dictionary)
+    print(f"Trained dictionary {dict_id} on {len(data)} samples, restart workers to use it")
+    return dict_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description='libup database maintenance')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('init-db', help='Create the tables in an empty database')
+    blobs = subparsers.add_parser('migrate-blobs', help='Move logs stored in the database into the blob store')
+    blobs.add_argument('--batch-size', default=100, type=int, help='Logs per transaction')
+    digests = subparsers.add_parser('backfill-digests', help='Store digests and sizes for older logs')
+    digests.add_argument('--batch-size', default=100, type=int, help='Logs per transaction')
+    subparsers.add_parser('backfill-advisories', help='Normalize stored audit reports into advisory rows')
+    parsed = subparsers.add_parser('backfill-versions', help='Parse the version of older dependencies')
+    parsed.add_argument('--batch-size', default=1000, type=int, help='Dependencies per transaction')
+    keep = subparsers.add_parser('retention', help='Compact old logs down to metadata and digests')
+    keep.add_argument('--keep', default=10, type=int, help='Full logs to keep per repository')
+    keep.add_argument('--batch-size', default=500, type=int, help='Logs per transaction')
+    keep.add_argument('--sleep', default=1.0, type=float, help='Seconds to wait between batches')
+    keep.add_argument('--dry-run', action='store_true', help='Only report what would be compacted')
+    sweep = subparsers.add_parser('sweep-blobs', help='Delete blobs only compacted logs refer to')
+    sweep.add_argument('--grace', default=3600, type=int,
+                       help='Keep blobs stored or reused in the last this many seconds')
+    zstd = subparsers.add_parser('train-zstd', help='Train a zstd compression dictionary on recent logs')
+    zstd.add_argument('--samples', default=2000, type=int, help='How many logs to sample')
+    zstd.add_argument('--size', default=112640, type=int, help='Dictionary size in bytes')
+    args = parser.parse_args()
+
+    if args.command == 'init-db':
+        init_db()
+        return
+    with db.session_scope() as session:
+        if args.command == 'migrate-blobs':
+            migrate_blobs(session, batch_size=args.batch_size)
+        elif args.command == 'backfill-digests':
+            backfill_digests(session, batch_size=args.batch_size)
+        elif args.command == 'backfill-advisories':
+            backfill_advisories(session)
+        elif args.command == 'backfill-versions':
+            backfill_versions(session, batch_size=args.batch_size)
+        elif args.command == 'retention':
+            retention(session, keep=args.keep, batch_size=args.batch_size, sleep=args.sleep,
+                      dry_run=args.dry_run)
+        elif args.command == 'sweep-blobs':
+            sweep_blobs(session, grace=args.grace)
+        elif args.command == 'train-zstd':
+            train_zstd(session, samples=args.samples, size=args.size)
+
+
+if __name__ == '__main__':
+    main()
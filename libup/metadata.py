@@ -15,9 +15,57 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+from concurrent.futures import ThreadPoolExecutor
 import json
+import os
+import requests
+import threading
+import time
+import traceback
+from typing import Collection, Dict, Iterable, Optional, Set, Tuple
 
-from . import PACKAGIST_MIRROR, session
+from . import CACHE, PACKAGIST_MIRROR, httpcache, jsonstream, session, versions
+
+CRATES_INDEX = 'https://index.crates.io'
+# Lists packages whose metadata changed since a given time
+PACKAGIST_CHANGES = 'https://packagist.org/metadata/changes.json'
+# Where we remember how far we've processed that feed
+PACKAGIST_CURSOR = os.path.join(CACHE, 'packagist-changes.json')
+# "Abbreviated" npm metadata, just what's needed to install a package
+NPM_ABBREVIATED = 'application/vnd.npm.install-v1+json'
+# Bytes to read at a time from streamed responses
+CHUNK_SIZE = 16 * 1024
+
+# Requests per second we allow ourselves against each registry
+RATE_LIMITS = {
+    'composer': 20,
+    'npm': 20,
+    # https://crates.io/policies#crawlers
+    'cargo': 1,
+    # The sparse index is served from a CDN
+    'cargo-index': 20,
+}
+
+
+class RateLimiter:
+    """spaces out calls to wait() so there are at most `rate` per second, across threads"""
+
+    def __init__(self, rate: float):
+        self.interval = 1 / rate
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        # Sleep outside the lock, the next caller already got a later slot
+        if slot > now:
+            time.sleep(slot - now)
+
+
+_limiters = {manager: RateLimiter(rate) for manager, rate in RATE_LIMITS.items()}
 
 
 def get_composer_metadata(package: str) -> dict:
@@ -27,19 +75,21 @@ def get_composer_metadata(package: str) -> dict:
             'latest': '0.0.0',
             'description': 'Unknown package',
         }
-    r = session.get(f'{PACKAGIST_MIRROR}/p2/{package}.json')
-    if not r.ok:
-        return {
-            'latest': '0.0.0',
-            'description': f'Unknown package (HTTP {r.status_code})'
-        }
+    return httpcache.get_cache().get(
+        f'{PACKAGIST_MIRROR}/p2/{package}.json',
+        lambda r: parse_composer_metadata(package, r),
+        wait=_limiters['composer'].wait
+    )
+
+
+def parse_composer_metadata(package: str, r: requests.Response) -> dict:
+    # Raise instead of returning a placeholder so the package is
+    # retried later and its recorded version isn't overwritten
+    r.raise_for_status()
     try:
         resp = r.json()['packages'][package]
-    except (KeyError, json.decoder.JSONDecodeError):
-        return {
-            'latest': '0.0.0',
-            'description': 'Unknown package',
-        }
+    except (KeyError, json.decoder.JSONDecodeError) as e:
+        raise ValueError(f'Unable to parse Packagist metadata for {package}') from e
     if not resp:
         return {
             'latest': '0.0.0',
@@ -60,13 +110,85 @@ def get_composer_metadata(package: str) -> dict:
     }
 
 
-def get_npm_metadata(package: str) -> dict:
-    r = session.get('https://registry.npmjs.org/%s' % package)
-    resp = r.json()
+def load_packagist_cursor() -> Tuple[Optional[int], Set[str]]:
+    """the saved cursor, and the composer packages to refetch regardless"""
+    try:
+        with open(PACKAGIST_CURSOR) as f:
+            data = json.load(f)
+        return data['timestamp'], set(data.get('retry', []))
+    except (FileNotFoundError, KeyError, json.decoder.JSONDecodeError):
+        return None, set()
+
+
+def save_packagist_cursor(timestamp: int, retry: Iterable[str] = ()):
+    """
+    :param retry: packages that changed but couldn't be fetched, the
+      cursor moves past their change so they need to be remembered
+    """
+    os.makedirs(os.path.dirname(PACKAGIST_CURSOR), exist_ok=True)
+    tmp = PACKAGIST_CURSOR + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'timestamp': timestamp, 'retry': sorted(retry)}, f)
+    os.replace(tmp, PACKAGIST_CURSOR)
+
+
+def packagist_changes(since: Optional[int]) -> Tuple[Optional[Set[str]], Optional[int]]:
+    """
+    Composer packages whose metadata changed since the given cursor, and
+    the cursor to use next time. The changed set is None if everything
+    needs to be refetched: there was no cursor yet, it was too old, or the
+    feed couldn't be read. The new cursor is None if we didn't get one.
+    """
+    _limiters['composer'].wait()
+    try:
+        r = session.get(PACKAGIST_CHANGES, params={'since': since} if since is not None else {})
+        resp = r.json()
+    except (requests.RequestException, json.decoder.JSONDecodeError):
+        return None, None
+    timestamp = resp.get('timestamp')
+    if since is None or not r.ok or 'actions' not in resp:
+        # Asking without a cursor is an error, but still tells us where to start
+        return None, timestamp
+    changed = set()
+    for action in resp['actions']:
+        if action['type'] == 'resync':
+            return None, timestamp
+        # Dev versions are listed as "vendor/name~dev"
+        changed.add(action['package'].split('~')[0])
+    return changed, timestamp
+
+
+def get_npm_metadata(package: str, description=True) -> dict:
+    """
+    The abbreviated metadata is much smaller, but doesn't include the
+    description, so only ask for the full document if we need that.
+    Either way, stop reading once we have the keys we're interested in.
+    """
+    keys: Tuple[str, ...]
+    if description:
+        keys = ('dist-tags', 'description')
+        headers = {}
+    else:
+        keys = ('dist-tags',)
+        headers = {'Accept': NPM_ABBREVIATED}
+    return httpcache.get_cache().get(
+        'https://registry.npmjs.org/%s' % package,
+        lambda r: parse_npm_metadata(r, keys),
+        headers=headers,
+        wait=_limiters['npm'].wait,
+        stream=True
+    )
+
+
+def parse_npm_metadata(r: requests.Response, keys=('dist-tags', 'description')) -> dict:
+    try:
+        resp = jsonstream.read_keys(r.iter_content(CHUNK_SIZE), keys)
+    except ValueError:
+        resp = {}
     # print('Latest %s: %s' % (package, version))
     try:
         latest = resp['dist-tags']['latest']
-        description = resp['description']
+        description = resp['description'] if 'description' in keys else None
     except KeyError:
         latest = '0.0.0'
         description = 'Unknown package'
@@ -76,26 +198,90 @@ def get_npm_metadata(package: str) -> dict:
     }
 
 
-def get_cargo_metadata(package: str) -> dict:
-    r = session.get(f"https://crates.io/api/v1/crates/{package}")
-    resp = r.json()["crate"]
-    # Get highest stable version if available, otherwise get highest version
-    # regardless of alpha/rc/etc. status
-    version = resp.get("max_stable_version")
-    if version is None:
-        version = resp["max_version"]
+def crates_index_path(package: str) -> str:
+    """path of a crate's file in the index, see https://doc.rust-lang.org/cargo/reference/registry-index.html"""
+    name = package.lower()
+    if len(name) <= 2:
+        return f"{len(name)}/{name}"
+    elif len(name) == 3:
+        return f"3/{name[0]}/{name}"
+    else:
+        return f"{name[0:2]}/{name[2:4]}/{name}"
+
+
+def get_cargo_metadata(package: str, description=True) -> dict:
+    """
+    The latest version comes from the sparse index, which is cheap to
+    revalidate, only the description needs the (rate limited) API.
+    """
+    latest = httpcache.get_cache().get(f"{CRATES_INDEX}/{crates_index_path(package)}", parse_crates_index,
+                                       wait=_limiters['cargo-index'].wait)
+    if latest is None:
+        # Rather than a placeholder that'd overwrite the recorded version
+        raise ValueError(f"Unable to get the latest version of {package} from the crates.io index")
+    desc = None
+    if description:
+        desc = httpcache.get_cache().get(f"https://crates.io/api/v1/crates/{package}",
+                                         lambda r: r.json()["crate"]["description"],
+                                         wait=_limiters['cargo'].wait)
     return {
-        "latest": version,
-        "description": resp["description"]
+        "latest": latest,
+        "description": desc,
     }
 
 
-def get_metadata(manager: str, name: str) -> dict:
+def parse_crates_index(r: requests.Response) -> Optional[str]:
+    """highest stable version that isn't yanked, from a sparse index file"""
+    if not r.ok:
+        return None
+    candidates = []
+    for line in r.text.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        version = versions.parse_version(entry["vers"])
+        if version is not None:
+            candidates.append((not entry.get("yanked", False), not version.prerelease, version.sort_key(),
+                               entry["vers"]))
+    if not candidates:
+        return None
+    # Prefer not yanked, then stable, if there are any, otherwise get
+    # highest version regardless of alpha/rc/etc. status
+    return max(candidates)[3]
+
+
+def get_metadata(manager: str, name: str, description=True) -> dict:
+    """
+    latest version and description of a package
+
+    :param description: if False, the description may be left as None
+      when it'd take extra work to get it
+    """
     if manager == "composer":
         return get_composer_metadata(name)
     elif manager == "npm":
-        return get_npm_metadata(name)
+        return get_npm_metadata(name, description=description)
     elif manager == "cargo":
-        return get_cargo_metadata(name)
+        return get_cargo_metadata(name, description=description)
     else:
         raise RuntimeError(f"Unknown manager: {manager}")
+
+
+def get_many_metadata(packages: Iterable[Tuple[str, str]], workers=8,
+                      known: Collection[Tuple[str, str]] = ()) -> Dict[Tuple[str, str], dict]:
+    """
+    get_metadata() for many (manager, name) pairs using a pool of threads,
+    still respecting RATE_LIMITS. Packages that fail are left out.
+
+    :param known: packages we already have a description for
+    """
+    def fetch(package):
+        try:
+            return package, get_metadata(*package, description=package not in known)
+        except Exception:
+            print(f"Unable to fetch metadata for {package[0]}:{package[1]}")
+            traceback.print_exc()
+            return package, None
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return {package: data for package, data in executor.map(fetch, packages) if data is not None}
@@ -17,30 +17,46 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from __future__ import annotations
 from collections import defaultdict
-import hashlib
 import json
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, LargeBinary, String
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, LargeBinary, String
 from sqlalchemy.dialects.mysql import MEDIUMBLOB
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, load_only, relationship, validates
 from sqlalchemy.ext.declarative import declarative_base
 from typing import List, Optional
 
-from . import utils
+from . import blobstore, utils, versions
 
 Base = declarative_base()
 
 
 class Dependency(Base):
     __tablename__ = "dependencies"
+    __table_args__ = (
+        Index("ix_dependencies_name_manager_version", "name", "manager",
+              "version_major", "version_minor", "version_patch"),
+        Index("ix_dependencies_repo_id", "repo_id"),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(80), nullable=False)
     version = Column(String(150), nullable=False)
     manager = Column(String(20), nullable=False)  # "composer", "npm", etc.
     mode = Column(String(4), nullable=False)  # "prod" or "dev"
     repo_id = Column(Integer, ForeignKey('repositories.id'))
+    # Lower bound of the version constraint, see versions.columns()
+    version_major = Column(Integer, nullable=True)
+    version_minor = Column(Integer, nullable=True)
+    version_patch = Column(Integer, nullable=True)
+    version_prerelease = Column(Boolean, nullable=True)
+    version_kind = Column(String(12), nullable=True)
 
     repository = relationship("Repository", back_populates="dependencies")
 
+    @validates("version")
+    def validate_version(self, key, value):
+        for column, parsed in versions.columns(value).items():
+            setattr(self, column, parsed)
+        return value
+
     def __lt__(self, other):
         return self.name < other.name
 
@@ -83,9 +99,37 @@ class Dependencies:
         return ret
 
 
+class DependencyChange(Base):
+    """A dependency being added, removed or changing version, recorded by db.sync_dependencies()"""
+    __tablename__ = "dependency_changes"
+    __table_args__ = (
+        Index("ix_dependency_changes_manager_name_time", "manager", "name", "time"),
+        Index("ix_dependency_changes_repo_id_time", "repo_id", "time"),
+    )
+    id = Column(Integer, primary_key=True)
+    repo_id = Column(Integer, ForeignKey('repositories.id'))
+    name = Column(String(80), nullable=False)
+    manager = Column(String(20), nullable=False)
+    mode = Column(String(4), nullable=False)
+    # Previous version, None if the dependency was added
+    old = Column(String(150), nullable=True)
+    # New version, None if the dependency was removed
+    new = Column(String(150), nullable=True)
+    # Time of the change in mw time format
+    time = Column(String(15), nullable=False)
+    # The run that noticed the change, filled in once the log exists
+    log_id = Column(Integer, ForeignKey('logs.id'), nullable=True)
+
+    repository = relationship("Repository", back_populates="dependency_changes")
+
+
 class Repository(Base):
     """Represents a repository+branch pair"""
     __tablename__ = "repositories"
+    __table_args__ = (
+        Index("ix_repositories_name_branch", "name", "branch"),
+        Index("ix_repositories_branch_name", "branch", "name"),
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String(80), nullable=False)
     # Branch used in web UI, e.g. "master" is normalized to "main"
@@ -105,8 +149,12 @@ class Repository(Base):
                         cascade="all, delete, delete-orphan", uselist=True)
     advisories = relationship("Advisories", back_populates="repository",
                               cascade="all, delete, delete-orphan", uselist=True)
+    advisory_entries = relationship("Advisory", back_populates="repository",
+                                    cascade="all, delete, delete-orphan", uselist=True)
     dependencies = relationship("Dependency", back_populates="repository",
                                 cascade="all, delete, delete-orphan", uselist=True)
+    dependency_changes = relationship("DependencyChange", back_populates="repository",
+                                      cascade="all, delete, delete-orphan", uselist=True)
 
     def __lt__(self, other):
         return self.name < other.name
@@ -130,56 +178,86 @@ class Repository(Base):
 class Log(Base):
     """Log of a libup run"""
     __tablename__ = "logs"
+    __table_args__ = (
+        Index("ix_logs_repo_id_id", "repo_id", "id"),
+        Index("ix_logs_patch_sha256", "patch_sha256"),
+        Index("ix_logs_text_sha256", "text_sha256"),
+    )
     id = Column(Integer, primary_key=True)
     repo_id = Column(Integer, ForeignKey('repositories.id'))
     # Time of entry in mw time format
     time = Column(String(15), nullable=False)
     # How long it took in seconds
     duration = Column(Integer, nullable=False, default=0)
-    # The actual log text (possibly compressed)
-    text = Column(LargeBinary().with_variant(MEDIUMBLOB, 'mysql'), nullable=False)  # type: ignore
+    # The actual log text (possibly compressed). The blobs are only loaded
+    # (together) when one of them is accessed.
+    text = deferred(Column(LargeBinary().with_variant(MEDIUMBLOB, 'mysql'), nullable=False),  # type: ignore
+                    group="blobs")
     # The patch file, if any (possibly compressed)
-    patch = Column(LargeBinary().with_variant(MEDIUMBLOB, 'mysql'), nullable=True)  # type: ignore
+    patch = deferred(Column(LargeBinary().with_variant(MEDIUMBLOB, 'mysql'), nullable=True),  # type: ignore
+                     group="blobs")
     # Whether the run ended in an error or not
     is_error = Column(Boolean, nullable=False, default=False)
     # Comma-separated hashtags to apply to the commit, if any
     hashtags = Column(LargeBinary, nullable=True)
     # sha1 of the commit this one is based on top of
     sha1 = Column(String(40), nullable=True)
+    # sha256 and size of the uncompressed text, set by set_text()
+    text_sha256 = Column(String(64), nullable=True)
+    text_size = Column(Integer, nullable=True)
+    # sha256 and size of the uncompressed patch, set by set_patch()
+    patch_sha256 = Column(String(64), nullable=True)
+    patch_size = Column(Integer, nullable=True)
+    # Whether the patch was pushed to Gerrit, NULL for runs from before this was tracked
+    is_pushed = Column(Boolean, nullable=True, default=False)
+    # Whether the text and patch were dropped by the retention job, leaving
+    # only the metadata and digests
+    is_compacted = Column(Boolean, nullable=False, default=False)
 
     repository = relationship("Repository", back_populates="logs")
 
     def __lt__(self, other):
         return self.id < other.id
 
+    @classmethod
+    def summary(cls):
+        """query option for listings, which don't need anything big"""
+        return load_only(cls.id, cls.repo_id, cls.time, cls.duration, cls.is_error)
+
     def get_text(self) -> str:
-        return utils.maybe_decompress(self.text)
+        return blobstore.load(self.text)
 
     def set_text(self, text: str):
-        self.text = utils.maybe_compress(text)
+        self.text_sha256 = blobstore.digest(text)
+        self.text_size = len(text.encode())
+        self.text = blobstore.store(text, key=self.text_sha256)
 
     def text_digest(self) -> str:
-        sha256 = hashlib.sha256()
-        sha256.update(self.get_text().encode())
-        return sha256.hexdigest()
+        if self.text_sha256 is not None:
+            return self.text_sha256
+        # Row from before digests were stored
+        return blobstore.digest(self.get_text())
 
     def get_patch(self) -> Optional[str]:
         if self.patch is not None:
-            return utils.maybe_decompress(self.patch)
+            return blobstore.load(self.patch)
         else:
             return None
 
     def set_patch(self, patch: Optional[str]):
         if patch is not None:
-            self.patch = utils.maybe_compress(patch)
+            self.patch_sha256 = blobstore.digest(patch)
+            self.patch_size = len(patch.encode())
+            self.patch = blobstore.store(patch, key=self.patch_sha256)
 
     def patch_digest(self) -> Optional[str]:
+        if self.patch_sha256 is not None:
+            return self.patch_sha256
+        # Row from before digests were stored
         patch = self.get_patch()
         if patch is None:
             return None
-        sha256 = hashlib.sha256()
-        sha256.update(patch.encode())
-        return sha256.hexdigest()
+        return blobstore.digest(patch)
 
     def get_hashtags(self) -> List[str]:
         if self.hashtags is None:
@@ -193,6 +271,9 @@ class Log(Base):
 class Upstream(Base):
     """Upstream metadata"""
     __tablename__ = "upstreams"
+    __table_args__ = (
+        Index("ix_upstreams_manager_name", "manager", "name"),
+    )
     id = Column(Integer, primary_key=True)
     # "npm" or "composer", etc.
     manager = Column(String(10), nullable=False)
@@ -223,6 +304,9 @@ class Upstream(Base):
 class Advisories(Base):
     """Security advisories"""
     __tablename__ = "advisories"
+    __table_args__ = (
+        Index("ix_advisories_repo_id", "repo_id"),
+    )
     id = Column(Integer, primary_key=True)
     repo_id = Column(Integer, ForeignKey('repositories.id'))
     # "npm" or "composer", etc.
@@ -239,6 +323,35 @@ class Advisories(Base):
         return json.loads(utils.maybe_decompress(self.data))
 
 
+class Advisory(Base):
+    """A single advisory affecting a repository, normalized from Advisories"""
+    __tablename__ = "advisory_entries"
+    __table_args__ = (
+        Index("ix_advisory_entries_manager_advisory_id", "manager", "advisory_id"),
+        Index("ix_advisory_entries_repo_id", "repo_id"),
+    )
+    id = Column(Integer, primary_key=True)
+    repo_id = Column(Integer, ForeignKey('repositories.id'))
+    # "npm" or "composer", etc.
+    manager = Column(String(10), nullable=False)
+    # Unique identifier for the advisory: npm advisory id, CVE, etc.
+    advisory_id = Column(String(150), nullable=False)
+    # Affected package
+    package = Column(String(150), nullable=False)
+    # "critical", "high", etc., if known
+    severity = Column(String(10), nullable=True)
+    # The advisory details as reported by the audit tool, in a JSON blob
+    info = Column(LargeBinary, nullable=False)
+
+    repository = relationship("Repository", back_populates="advisory_entries")
+
+    def set_info(self, info: dict):
+        self.info = json.dumps(info).encode()
+
+    def get_info(self) -> dict:
+        return json.loads(self.info)
+
+
 class Monitoring(Base):
     """Phabricator release monitoring"""
     __tablename__ = "monitoring"
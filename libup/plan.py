@@ -15,23 +15,38 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-import re
-import semver
-import semver.exceptions
-from sqlalchemy.orm import joinedload
-from typing import List, Dict, Optional
+from collections import defaultdict
+import hashlib
+import json
+from sqlalchemy import and_, case, func, or_
+import threading
+from typing import List, Dict, Optional, Tuple
 
-from . import config
-from .model import Dependency, Repository
+from . import config, versions
+from .model import Dependency, DependencyChange, Repository
+
+_readiness_lock = threading.Lock()
+# branch -> (cache key, {(manager, name): whether the canaries have the update})
+_readiness: Dict[str, Tuple[tuple, Dict[Tuple[str, str], bool]]] = {}
 
 
 class Plan:
     """What's the update plan?"""
-    def __init__(self, branch, pull=False):
+    def __init__(self, branch, pull=False, releases: Optional[dict] = None):
+        """
+        :param releases: a releases.json to use instead of the one in the
+          config repo, e.g. to simulate changes to it
+        """
         self.branch = branch
         self.canaries = config.repositories(pull=pull)['canaries']
-        # Don't bother pulling for this, we just did above
-        self.releases = config.releases(pull=False).get(branch, {})
+        if releases is None:
+            # Don't bother pulling for this, we just did above
+            releases = config.releases(pull=False)
+        self.releases = releases.get(branch, {})
+        # Identifies this version of the config, for caching
+        self.revision = hashlib.sha1(
+            json.dumps([self.releases, self.canaries], sort_keys=True).encode()
+        ).hexdigest()
 
     def safe_version(self, manager: str, name: str) -> Optional[str]:
         try:
@@ -44,41 +59,39 @@ class Plan:
         if repo in self.canaries:
             return self._check_canary(deps)
         else:
-            return self._check_regular(session, deps)
-
-    def status_canaries(self, session, dep: Dependency, expected) -> Dict[str, List[Repository]]:
-        """canaries that don't and do have this update"""
-        canaries = session.query(Dependency).join(Repository)\
-            .filter(Dependency.name == dep.name, Dependency.manager == dep.manager,
-                    Repository.name.in_(self.canaries), Repository.branch == self.branch)\
-            .options(joinedload(Dependency.repository))\
-            .all()
-        ret: Dict[str, List[Repository]] = {'missing': [], 'updated': []}
-        for canary in canaries:
-            if not equals(canary.version, expected):
-                ret['missing'].append(canary.repository)
-            else:
-                ret['updated'].append(canary.repository)
-        session.close()
-        return ret
-
-    def status_repositories(self, session, dep: Dependency, expected) -> Dict[str, List[Repository]]:
-        """repositories that don't have this update"""
-        repos = session.query(Dependency).join(Repository)\
-            .filter(Dependency.name == dep.name, Dependency.manager == dep.manager,
-                    Repository.branch == self.branch)\
-            .options(joinedload(Dependency.repository))\
-            .all()
-        ret: Dict[str, List[Repository]] = {'missing': [], 'updated': []}
-        for repo in repos:
-            if not equals(repo.version, expected):
-                ret['missing'].append(repo.repository)
+            return self._check_regular(deps, self.canary_readiness(session))
+
+    def check_many(self, session, repos: Optional[List[str]] = None, gated=True) -> Dict[str, list]:
+        """
+        check() for many repositories of this branch at once, or all of
+        them if repos isn't given. Repositories that don't exist are left
+        out. The tracked dependencies are loaded with a single query.
+
+        :param gated: if False, plan as if the canaries were all updated
+        """
+        names = {name for packages in self.releases.values() for name in packages}
+        query = session.query(Repository.name.label('repo'), Dependency.manager, Dependency.name,
+                              Dependency.version)\
+            .select_from(Repository)\
+            .outerjoin(Dependency, and_(Dependency.repo_id == Repository.id, Dependency.name.in_(names)))\
+            .filter(Repository.branch == self.branch)
+        if repos is not None:
+            query = query.filter(Repository.name.in_(repos))
+        deps: Dict[str, list] = {}
+        for row in query:
+            repo_deps = deps.setdefault(row.repo, [])
+            if row.manager is not None:
+                repo_deps.append(row)
+        readiness = self.canary_readiness(session) if gated else {}
+        plans = {}
+        for repo, repo_deps in deps.items():
+            if repo in self.canaries:
+                plans[repo] = self._check_canary(repo_deps)
             else:
-                ret['updated'].append(repo.repository)
-        session.close()
-        return ret
+                plans[repo] = self._check_regular(repo_deps, readiness)
+        return plans
 
-    def _check_regular(self, session, deps: List[Dependency]) -> list:
+    def _check_regular(self, deps: List[Dependency], readiness: Dict[Tuple[str, str], bool]) -> list:
         updates = []
         for dep in deps:
             try:
@@ -89,8 +102,7 @@ class Plan:
             if 'skip' in info and dep.version.startswith(tuple(info['skip'])):
                 # To be skipped
                 continue
-            status = self.status_canaries(session, dep, info['to'])
-            if status['missing']:
+            if not readiness.get((dep.manager, dep.name), True):
                 # Canaries aren't ready yet
                 continue
             if not equals(dep.version, info['to']):
@@ -98,6 +110,37 @@ class Plan:
 
         return updates
 
+    def canary_readiness(self, session) -> Dict[Tuple[str, str], bool]:
+        """
+        for every tracked package, whether all the canaries have the update.
+        Cached per branch until the config or a canary's dependencies change.
+        """
+        last_change = session.query(func.max(DependencyChange.id))\
+            .join(Repository, DependencyChange.repo_id == Repository.id)\
+            .filter(Repository.name.in_(self.canaries), Repository.branch == self.branch)\
+            .scalar()
+        key = (self.revision, last_change)
+        with _readiness_lock:
+            cached = _readiness.get(self.branch)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+
+        readiness = {
+            (manager, name): True
+            for manager, packages in self.releases.items()
+            for name in packages
+        }
+        canaries = session.query(Dependency.manager, Dependency.name, Dependency.version)\
+            .join(Repository)\
+            .filter(Repository.name.in_(self.canaries), Repository.branch == self.branch)
+        for canary in canaries:
+            package = (canary.manager, canary.name)
+            if package in readiness and not equals(canary.version, self.releases[canary.manager][canary.name]['to']):
+                readiness[package] = False
+        with _readiness_lock:
+            _readiness[self.branch] = (key, readiness)
+        return readiness
+
     def _check_canary(self, deps: List[Dependency]) -> list:
         updates = []
         for dep in deps:
@@ -114,59 +157,117 @@ class Plan:
 
         return updates
 
-    def status(self, session):
-        status = {}
-        for manager, packages in self.releases.items():
-            status[manager] = {}
-            for name, info in packages.items():
-                dep = Dependency(name=name, manager=manager)
-                canaries = self.status_canaries(session, dep, info['to'])
-                canaries_total = len(canaries['missing']) + len(canaries['updated'])
-                if canaries_total > 0:
-                    canaries_percent = int(100 * len(canaries['updated']) / canaries_total)
-                else:
-                    canaries_percent = 100
-                repositories = self.status_repositories(session, dep, info['to'])
-                repositories_total = len(repositories['missing']) + len(repositories['updated'])
-                if repositories_total > 0:
-                    repositories_percent = int(100 * len(repositories['updated']) / repositories_total)
-                else:
-                    repositories_percent = 100
-                status[manager][name] = {
-                    'info': info,
-                    'stats': {
-                        'canaries': {
-                            'total': canaries_total,
-                            'percent': canaries_percent
-                        },
-                        'repositories': {
-                            'total': repositories_total,
-                            'percent': repositories_percent
-                        }
-                    },
-                    'canaries': canaries,
-                    'repositories': repositories
-                }
+    def rollout(self, session, manager: str, name: str) -> Optional[Dict[str, int]]:
+        """
+        how many repositories are at or above the safe version, counted in
+        SQL using the parsed version columns. Agrees with equals().
+        """
+        safe_version = self.safe_version(manager, name)
+        if safe_version is None:
+            return None
+        wanted = versions.parse_version(safe_version)
+        if wanted is None:
+            return None
+        same = and_(Dependency.version_major == wanted.major,
+                    Dependency.version_minor == wanted.minor,
+                    Dependency.version_patch == wanted.patch)
+        above = or_(
+            Dependency.version_major > wanted.major,
+            and_(Dependency.version_major == wanted.major, or_(
+                Dependency.version_minor > wanted.minor,
+                and_(Dependency.version_minor == wanted.minor,
+                     Dependency.version_patch > wanted.patch)
+            ))
+        )
+        at_least = or_(
+            Dependency.version == safe_version,
+            # Special npm syntax, see equals()
+            Dependency.version.like('file:%'),
+            above,
+            # A release is above any of its prereleases
+            and_(same, Dependency.version_prerelease.isnot(True)),
+        )
+        query = session.query(Dependency.version, func.count(Dependency.id))\
+            .join(Repository)\
+            .filter(Dependency.name == name, Dependency.manager == manager,
+                    Repository.branch == self.branch)
+        total, updated = query.with_entities(func.count(Dependency.id),
+                                             func.sum(case([(at_least, 1)], else_=0)))\
+            .one()
+        updated = updated or 0
+        if wanted.prerelease:
+            # Prereleases of the same version need their identifiers
+            # compared, which the columns don't have
+            rows = query.filter(same, Dependency.version_prerelease.is_(True),
+                                Dependency.version != safe_version)\
+                .group_by(Dependency.version).all()
+            compared = versions.at_least_many([version for version, _ in rows], safe_version)
+            updated += sum(count for version, count in rows if compared[version])
+        return {'total': total, 'updated': updated}
+
+    def status(self, session) -> Dict[str, dict]:
+        """rollout stats of every package in releases.json, from a single query"""
+        tracked = {
+            (manager, name): info
+            for manager, packages in self.releases.items()
+            for name, info in packages.items()
+        }
+        found: Dict[Tuple[str, str], Dict[str, Dict[str, List[Repository]]]] = {
+            package: {
+                'canaries': {'missing': [], 'updated': []},
+                'repositories': {'missing': [], 'updated': []},
+            }
+            for package in tracked
+        }
+        if tracked:
+            rows = session.query(Dependency.manager, Dependency.name, Dependency.version, Repository)\
+                .join(Repository)\
+                .filter(Repository.branch == self.branch,
+                        Dependency.name.in_({name for _, name in tracked}))
+            rows = [row for row in rows if (row.manager, row.name) in tracked]
+            # Many repositories use the same version, only compare each once
+            used: Dict[Tuple[str, str], set] = defaultdict(set)
+            for manager, name, version, _ in rows:
+                used[(manager, name)].add(version)
+            updated = {
+                package: versions.at_least_many(used_versions, tracked[package]['to'])
+                for package, used_versions in used.items()
+            }
+            for manager, name, version, repo in rows:
+                bucket = 'updated' if updated[(manager, name)][version] else 'missing'
+                found[(manager, name)]['repositories'][bucket].append(repo)
+                if repo.name in self.canaries:
+                    found[(manager, name)]['canaries'][bucket].append(repo)
+
+        status: Dict[str, dict] = {manager: {} for manager in self.releases}
+        for (manager, name), info in tracked.items():
+            canaries = found[(manager, name)]['canaries']
+            repositories = found[(manager, name)]['repositories']
+            status[manager][name] = {
+                'info': info,
+                'stats': {
+                    'canaries': stats(canaries),
+                    'repositories': stats(repositories),
+                },
+                'canaries': canaries,
+                'repositories': repositories
+            }
 
         return status
 
 
+def stats(repos: Dict[str, List[Repository]]) -> dict:
+    total = len(repos['missing']) + len(repos['updated'])
+    if total > 0:
+        percent = int(100 * len(repos['updated']) / total)
+    else:
+        percent = 100
+    return {'total': total, 'percent': percent}
+
+
 def equals(current, wanted):
     """
     for the purpose of deciding whether want to upgrade, is the
     current version OK enough or do we need to intervene?
     """
-    if current == wanted:
-        return True
-    if current.startswith('file:'):
-        # Special npm syntax (see wdio-mediawiki in mediawiki/core)
-        return True
-    try:
-        # Remove some constraint stuff because we just want versions
-        first = re.sub(r'[\^~><=]', '', current)
-        if semver.Version.parse(first) >= semver.Version.parse(wanted):
-            return True
-    except semver.exceptions.ParseVersionError:
-        pass
-
-    return False
+    return versions.at_least(current, wanted)
@@ -15,6 +15,8 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+from sqlalchemy.orm import object_session
+from sqlalchemy.sql.expression import func
 import subprocess
 import urllib.parse
 
@@ -105,9 +107,11 @@ class Pusher(shell.ShellMixin):
 
     def is_latest(self, log: Log, repo: Repository) -> bool:
         """Make sure this is the latest log for this repository"""
-        logs = repo.logs
-        if logs[-1].id != log.id:
-            print(f"Newer run available: we are {log.id} but {logs[-1].id} exists, skipping")
+        latest = object_session(log).query(func.max(Log.id))\
+            .filter(Log.repo_id == repo.id)\
+            .scalar()
+        if latest != log.id:
+            print(f"Newer run available: we are {log.id} but {latest} exists, skipping")
             return False
         return True
 
@@ -143,3 +147,6 @@ class Pusher(shell.ShellMixin):
         push = config.should_push()
         self.git_push(repo, hashtags=hashtags, message=message,
                       plus2=plus2, push=push)
+        if push:
+            # Keep this log around, see maintenance.retention()
+            log.is_pushed = True
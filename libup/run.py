@@ -21,7 +21,7 @@ import argparse
 from datetime import datetime
 import wikimediaci_utils as ci_utils
 
-from . import config, db, gerrit, monitoring, mw, phab, utils
+from . import config, db, gerrit, monitoring, mw, phab, plan, utils
 from .model import Monitoring, Repository
 from .tasks import run_check
 
@@ -119,6 +119,8 @@ def main():
     parser.add_argument('--branch', required=False, help='Limit to only these branches')
     parser.add_argument('--auto', action='store_true', help='If this is an automatic run')
     parser.add_argument('--only-monitoring', action='store_true', help="Run only monitoring checks")
+    parser.add_argument('--pending', action='store_true',
+                        help='Only queue repositories with pending dependency updates')
     parser.add_argument('repo', nargs='?', help='Only queue this repository (optional)')
     args = parser.parse_args()
 
@@ -163,6 +165,13 @@ def main():
     else:
         branches = config.branches()
     print(f"Limiting to branches: {', '.join(branches)}")
+    if args.pending:
+        pending = set()
+        for branch in branches:
+            plans = plan.Plan(branch).check_many(session)
+            pending.update((repo, branch) for repo, updates in plans.items() if updates)
+        gen = [repo for repo in gen if (repo.name, repo.branch) in pending]
+        print(f"{len(gen)} repositories have pending updates")
     gen = sorted(gen, key=lambda r: (r.name, r.branch))
     for repo in gen:
         if repo.branch not in branches:
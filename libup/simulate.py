@@ -0,0 +1,122 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import argparse
+import json
+from typing import Dict
+
+from . import config, db, plan, utils
+
+# Keep in sync with the runner
+WEIGHT_NEEDED = 10
+
+
+def parse_releases(text: str) -> dict:
+    """parse and validate a candidate releases.json"""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON: {e}")
+    if not isinstance(data, dict) or data.get('version') != 2:
+        raise ValueError("Expected a version 2 releases.json")
+    for branch, managers in data.items():
+        if branch in ('version', 'push'):
+            continue
+        if not isinstance(managers, dict):
+            raise ValueError(f"{branch}: expected an object")
+        for manager, packages in managers.items():
+            if not isinstance(packages, dict):
+                raise ValueError(f"{branch}: {manager}: expected an object")
+            for name, info in packages.items():
+                if not isinstance(info, dict):
+                    raise ValueError(f"{branch}: {manager}: {name}: expected an object")
+                for key, type_, kind in (('to', str, 'a string'), ('weight', int, 'an integer')):
+                    if key not in info:
+                        raise ValueError(f"{branch}: {manager}: {name} is missing \"{key}\"")
+                    # bool is a subclass of int
+                    if not isinstance(info[key], type_) or isinstance(info[key], bool):
+                        raise ValueError(f"{branch}: {manager}: {name}: \"{key}\" must be {kind}")
+    return data
+
+
+def summarize(plans: Dict[str, list]) -> dict:
+    """what the runner would do with these plans"""
+    repositories = {}
+    for repo, updates in plans.items():
+        if not updates:
+            continue
+        weight = sum(update[3] for update in updates)
+        repositories[repo] = {
+            'updates': updates,
+            'weight': weight,
+            'push': weight >= WEIGHT_NEEDED,
+        }
+    return {
+        'affected': len(repositories),
+        'patches': sum(1 for info in repositories.values() if info['push']),
+        'weight': sum(info['weight'] for info in repositories.values()),
+        'repositories': repositories,
+    }
+
+
+def simulate(session, branch: str, releases: dict) -> dict:
+    """
+    Compare what the current and a candidate releases.json would do to
+    every repository of the branch, as if the canaries were already
+    updated. Each side is a single query, see Plan.check_many().
+    """
+    current = plan.Plan(branch).check_many(session, gated=False)
+    candidate = plan.Plan(branch, releases=releases).check_many(session, gated=False)
+    return {
+        'branch': branch,
+        'current': summarize(current),
+        'candidate': summarize(candidate),
+        'changed': sorted(repo for repo in candidate if candidate[repo] != current.get(repo, [])),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='See what a releases.json change would do')
+    parser.add_argument('releases', help='Path to the candidate releases.json')
+    parser.add_argument('--branch', default='main', help='Branch to simulate')
+    parser.add_argument('--verbose', action='store_true', help='List every affected repository')
+    args = parser.parse_args()
+    with open(args.releases) as f:
+        releases = parse_releases(f.read())
+    branch = utils.normalize_branch(args.branch)
+    if branch not in config.branches():
+        raise SystemExit(f"Unknown branch: {branch}")
+    with db.session_scope() as session:
+        result = simulate(session, branch, releases)
+    for side in ('current', 'candidate'):
+        summary = result[side]
+        print(f"{side}: {summary['affected']} repositories affected, {summary['patches']} patches "
+              f"expected, total weight {summary['weight']}")
+    print(f"{len(result['changed'])} repositories would get a different plan")
+    if args.verbose:
+        for repo in result['changed']:
+            info = result['candidate']['repositories'].get(repo)
+            if info is None:
+                print(f"* {repo}: nothing to do")
+                continue
+            updates = ', '.join(f"{name} {to}" for _, name, to, _ in info['updates'])
+            push = 'push' if info['push'] else 'no push'
+            print(f"* {repo}: {updates} (weight {info['weight']}, {push})")
+
+
+if __name__ == '__main__':
+    main()
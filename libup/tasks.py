@@ -26,7 +26,7 @@ import tempfile
 import time
 import traceback
 
-from . import GIT_ROOT, MANAGERS, db, docker, gerrit, model, push, utils, ssh
+from . import GIT_ROOT, MANAGERS, db, docker, gerrit, model, plan, push, utils, ssh
 from .extract import extract_dependencies
 
 app = Celery('tasks', broker='amqp://localhost')
@@ -35,26 +35,26 @@ app.conf.task_routes = {'libup.tasks.run_push': {'queue': 'push'}}
 
 @app.task
 def run_check(repo_name: str, branch: str):
-    session = db.Session()
-    repo: model.Repository = session.query(model.Repository).filter_by(name=repo_name, branch=branch).first()
-    # Update our local clone
     start = time.monotonic()
-    gerrit.ensure_clone(repo.name, repo.get_git_branch())
-    with tempfile.TemporaryDirectory(prefix="libup-extract") as tmpdir:
-        with utils.cd(tmpdir):
-            # TODO: Move this logic out of pusher?
-            pusher = push.Pusher()
-            pusher.clone(repo.name, internal=True, branch=repo.get_git_branch())
-            deps = extract_dependencies(repo)
-            db.update_dependencies(session, repo, deps)
-
-    # Commit everything, which should close the transaction
-    session.commit()
-    # Drop all the database-related stuff
-    git_branch = repo.get_git_branch()
-    del repo
-    session.close()
-    del session
+    with db.session_scope() as session:
+        repo: model.Repository = session.query(model.Repository).filter_by(name=repo_name, branch=branch).first()
+        # Update our local clone
+        gerrit.ensure_clone(repo.name, repo.get_git_branch())
+        with tempfile.TemporaryDirectory(prefix="libup-extract") as tmpdir:
+            with utils.cd(tmpdir):
+                # TODO: Move this logic out of pusher?
+                pusher = push.Pusher()
+                pusher.clone(repo.name, internal=True, branch=repo.get_git_branch())
+                deps = extract_dependencies(repo)
+                db.update_dependencies(session, repo, deps)
+
+        # Computed here rather than by the runner asking the web service.
+        # Don't pull the config, the periodic libup-run keeps it fresh,
+        # and concurrent pulls from several workers collide in the checkout
+        upgrades = plan.Plan(branch).check(session, repo.name, repo.dependencies)
+        git_branch = repo.get_git_branch()
+    # The session has been committed and closed, and its connection returned
+    # to the pool, so we don't hold it while the container is running
 
     container_name = repo_name.split('/')[-1] + '-' + branch
     with tempfile.TemporaryDirectory(prefix="libup-container") as tmpdir:
@@ -66,6 +66,8 @@ def run_check(repo_name: str, branch: str):
             stat.S_IRGRP | stat.S_IWGRP | stat.S_IXGRP |
             stat.S_IROTH | stat.S_IWOTH | stat.S_IXOTH
         )
+        with open(os.path.join(tmpdir, 'plan.json'), 'w') as f:
+            json.dump(upgrades, f)
         try:
             docker.run(
                 name=container_name,
@@ -76,7 +78,8 @@ def run_check(repo_name: str, branch: str):
                     GIT_ROOT: f'{GIT_ROOT}:ro'
                 },
                 rm=True,
-                extra_args=['runner', repo_name, '/out/output.json', f"--branch={git_branch}"],
+                extra_args=['runner', repo_name, '/out/output.json', f"--branch={git_branch}",
+                            '--plan=/out/plan.json'],
             )
         except subprocess.CalledProcessError:
             # Just print the traceback, we still need to save the log
@@ -86,51 +89,54 @@ def run_check(repo_name: str, branch: str):
 
     end = time.monotonic()
 
-    # Open a new db connection and session
-    db.connect()
-    session = db.Session()
-    repo2: model.Repository = session.query(model.Repository).filter_by(name=repo_name, branch=branch).first()
-    log = model.Log(
-        time=utils.to_mw_time(datetime.utcnow()),
-        is_error='done' not in data,
-        sha1=data['sha1'],
-        duration=int(end - start),
-    )
-    # TODO: Get this from `docker logs` instead
-    log.set_text('\n'.join(data.get('log', [])))
-    log.set_patch(data.get('patch'))
-    log.set_hashtags(data.get('hashtags', []))
-    repo2.logs.append(log)
-    repo2.is_error = log.is_error
-    for manager in MANAGERS:
-        advisories = repo2.get_advisories(manager)
-        new = data["audits"].get(manager)
-        if advisories and new:
-            # Update existing row
-            advisories.set_data(new)
-        elif advisories and not new:
-            # No more vulns, delete row
-            session.delete(advisories)
-        elif new and not advisories:
-            advisories = model.Advisories(manager=manager)
-            advisories.set_data(new)
-            repo2.advisories.append(advisories)
-        # else: not new and not advisories:
-            # pass - nothing to do
-
-    # Commit everything
-    session.commit()
-
-    if data.get('push'):
-        # Queue push task
-        text_digest = log.text_digest()
-        patch_digest = log.patch_digest()
-        run_push.delay(log.id, text_digest, patch_digest)
-        print(f"Queuing patch for {repo2.name} ({repo2.branch})")
-    elif data.get('patch'):
-        print(f"Skipping pushing patch for {repo2.name} ({repo2.branch})")
-
-    session.close()
+    with db.session_scope() as session:
+        repo2: model.Repository = session.query(model.Repository).filter_by(name=repo_name, branch=branch).first()
+        log = model.Log(
+            repo_id=repo2.id,
+            time=utils.to_mw_time(datetime.utcnow()),
+            is_error='done' not in data,
+            sha1=data['sha1'],
+            duration=int(end - start),
+        )
+        # TODO: Get this from `docker logs` instead
+        log.set_text('\n'.join(data.get('log', [])))
+        log.set_patch(data.get('patch'))
+        log.set_hashtags(data.get('hashtags', []))
+        # Not repo2.logs.append(), that would load every log of the repository
+        session.add(log)
+        # Assign log.id, so the dependency changes of this run can point to it
+        session.flush()
+        db.link_dependency_changes(session, repo2.id, log.id)
+        repo2.is_error = log.is_error
+        for manager in MANAGERS:
+            advisories = repo2.get_advisories(manager)
+            new = data["audits"].get(manager)
+            if advisories and new:
+                # Update existing row
+                advisories.set_data(new)
+            elif advisories and not new:
+                # No more vulns, delete row
+                session.delete(advisories)
+            elif new and not advisories:
+                advisories = model.Advisories(manager=manager)
+                advisories.set_data(new)
+                repo2.advisories.append(advisories)
+            # else: not new and not advisories:
+                # pass - nothing to do
+            # And the normalized version, for the vulns pages
+            db.sync_advisories(session, repo2.id, manager, new)
+
+        # Commit everything, so log.id is assigned before queuing the push
+        session.commit()
+
+        if data.get('push'):
+            # Queue push task
+            text_digest = log.text_digest()
+            patch_digest = log.patch_digest()
+            run_push.delay(log.id, text_digest, patch_digest)
+            print(f"Queuing patch for {repo2.name} ({repo2.branch})")
+        elif data.get('patch'):
+            print(f"Skipping pushing patch for {repo2.name} ({repo2.branch})")
 
 
 @app.task
@@ -139,23 +145,21 @@ def run_push(log_id, text_digest, patch_digest):
         raise RuntimeError("ssh-agent isn't loaded")
     # Flood control, don't overload zuul...
     gerrit.wait_for_zuul_test_gate(count=2)
-    db.connect()
-    session = db.Session()
-    log = session.query(model.Log).filter_by(id=log_id).first()
-    if log is None:
-        raise RuntimeError(f"Cannot find log_id: {log_id}")
-    if text_digest != log.text_digest():
-        raise RuntimeError(f"Text integrity issue, expected {text_digest} got {log.text_digest()}")
-    if patch_digest != log.patch_digest():
-        raise RuntimeError(f"Text integrity issue, expected {patch_digest} got {log.patch_digest()}")
-
-    repo = log.repository
-    with tempfile.TemporaryDirectory() as tmpdir:
-        with utils.cd(tmpdir):
-            pusher = push.Pusher()
-            pusher.run(log, repo)
-
-    session.close()
+    with db.session_scope() as session:
+        log = session.query(model.Log).filter_by(id=log_id).first()
+        if log is None:
+            raise RuntimeError(f"Cannot find log_id: {log_id}")
+        if text_digest != log.text_digest():
+            raise RuntimeError(f"Text integrity issue, expected {text_digest} got {log.text_digest()}")
+        if patch_digest != log.patch_digest():
+            raise RuntimeError(f"Text integrity issue, expected {patch_digest} got {log.patch_digest()}")
+
+        repo = log.repository
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with utils.cd(tmpdir):
+                pusher = push.Pusher()
+                pusher.run(log, repo)
+
     # Give CI a bit of time to accept the patch
     time.sleep(5)
 
@@ -17,14 +17,30 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 from contextlib import contextmanager
 from datetime import datetime
+import functools
 import gzip
 import lzma
 import os
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
 
-from . import GIT_ROOT
+try:
+    import zstandard
+except ImportError:
+    zstandard = None  # type: ignore
+
+from . import DATA_ROOT, GIT_ROOT
 
 # 2^16 per https://dev.mysql.com/doc/refman/8.0/en/storage-requirements.html
 BLOB_SIZE = 65536
+# Trained zstd dictionaries, stored as <dict_id>.dict, plus a CURRENT
+# file with the id of the one to compress new data with
+ZSTD_DICTIONARIES = os.path.join(DATA_ROOT, 'zstd')
+ZSTD_LEVEL = 10
+# Unlike l: and g:, short texts are zstd compressed too, so the prefix
+# mustn't be something inline text could start with. 0xff never appears
+# in UTF-8.
+ZSTD_PREFIX = b'\xffz:'
 
 
 @contextmanager
@@ -60,7 +76,71 @@ def from_mw_time(mw: str) -> datetime:
     return datetime.strptime(mw, '%Y%m%d%H%M%S')
 
 
+@functools.lru_cache(maxsize=None)
+def zstd_dictionary(dict_id: int):
+    path = Path(ZSTD_DICTIONARIES) / f"{dict_id}.dict"
+    return zstandard.ZstdCompressionDict(path.read_bytes())
+
+
+@functools.lru_cache(maxsize=None)
+def current_zstd_dictionary_id() -> Optional[int]:
+    """
+    id of the dictionary new data should be compressed with, or None if
+    zstd isn't available or no dictionary has been trained yet. Cached for
+    the lifetime of the process, so restart after training a new one.
+    """
+    if zstandard is None:
+        return None
+    current = Path(ZSTD_DICTIONARIES) / 'CURRENT'
+    if not current.exists():
+        return None
+    return int(current.read_text().strip())
+
+
+def save_zstd_dictionary(dictionary) -> int:
+    """save a freshly trained dictionary and make it the current one"""
+    dict_id = dictionary.dict_id()
+    path = Path(ZSTD_DICTIONARIES)
+    path.mkdir(parents=True, exist_ok=True)
+    (path / f"{dict_id}.dict").write_bytes(dictionary.as_bytes())
+    (path / 'CURRENT').write_text(f"{dict_id}\n")
+    current_zstd_dictionary_id.cache_clear()
+    return dict_id
+
+
+def zstd_compress(data: bytes) -> bytes:
+    dict_id = current_zstd_dictionary_id()
+    dictionary = zstd_dictionary(dict_id) if dict_id is not None else None
+    return zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dictionary).compress(data)
+
+
+def zstd_decompress(data: bytes) -> bytes:
+    if zstandard is None:
+        raise RuntimeError('zstandard is required to read zstd compressed data')
+    # The frame header records which dictionary was used, if any
+    dict_id = zstandard.get_frame_parameters(data).dict_id
+    dictionary = zstd_dictionary(dict_id) if dict_id else None
+    return zstandard.ZstdDecompressor(dict_data=dictionary).decompress(data)
+
+
+# prefix -> (compress, decompress)
+CODECS: Dict[bytes, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    ZSTD_PREFIX: (zstd_compress, zstd_decompress),
+    b'l:': (lzma.compress, lzma.decompress),
+    b'g:': (gzip.compress, gzip.decompress),
+}
+
+
+def compress(text: str, prefix: bytes) -> bytes:
+    """compress with a specific codec"""
+    return prefix + CODECS[prefix][0](text.encode())
+
+
 def maybe_compress(text: str) -> bytes:
+    if current_zstd_dictionary_id() is not None:
+        # Log output is very repetitive across repositories, so with a
+        # trained dictionary even short texts are worth compressing
+        return compress(text, ZSTD_PREFIX)
     encoded = text.encode()
     if len(encoded) >= BLOB_SIZE:
         return b'l:' + lzma.compress(encoded)
@@ -69,12 +149,10 @@ def maybe_compress(text: str) -> bytes:
 
 
 def maybe_decompress(data: bytes) -> str:
-    if data.startswith(b'l:'):
-        return lzma.decompress(data[2:]).decode()
-    elif data.startswith(b'g:'):
-        return gzip.decompress(data[2:]).decode()
-    else:
-        return data.decode()
+    for prefix, (_, decompress) in CODECS.items():
+        if data.startswith(prefix):
+            return decompress(data[len(prefix):]).decode()
+    return data.decode()
 
 
 def normalize_branch(branch: str) -> str:
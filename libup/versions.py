@@ -0,0 +1,195 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import functools
+import re
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+VERSION = re.compile(
+    r'^v?(?P<major>\d+)(?:\.(?P<minor>\d+|[x*]))?(?:\.(?P<patch>\d+|[x*]))?(?:\.\d+)?'
+    r'(?:-(?P<pre>[0-9A-Za-z.-]+))?(?:\+[0-9A-Za-z.-]+)?$',
+    re.IGNORECASE
+)
+OPERATOR = re.compile(r'^(\^|~>|~|>=|<=|!=|>|<|==|=)\s*')
+# composer stability flags, e.g. "1.0.0@beta"
+STABILITY = re.compile(r'@[a-z]+$', re.IGNORECASE)
+HYPHEN_RANGE = re.compile(r'^(\S+)\s+-\s+(\S+)$')
+# Dependency columns filled in by columns()
+COLUMNS = ('version_kind', 'version_major', 'version_minor', 'version_patch', 'version_prerelease')
+# How many distinct version strings to keep parsed, per cache
+CACHE_SIZE = 8192
+OPERATOR_KINDS = {
+    '^': 'caret',
+    '~': 'tilde',
+    '~>': 'tilde',
+}
+
+
+class Version(NamedTuple):
+    major: int
+    minor: int
+    patch: int
+    # Empty for releases
+    prerelease: Tuple[str, ...] = ()
+
+    def sort_key(self) -> tuple:
+        """prereleases sort before the release, identifiers per semver"""
+        if not self.prerelease:
+            return self.major, self.minor, self.patch, 1, ()
+        parts = tuple((0, int(part), '') if part.isdigit() else (1, 0, part) for part in self.prerelease)
+        return self.major, self.minor, self.patch, 0, parts
+
+
+ZERO = Version(0, 0, 0)
+
+
+class Constraint(NamedTuple):
+    # "exact", "caret", "tilde", "range", "wildcard", "alternatives" or "other"
+    kind: str
+    # Lowest version allowed by the constraint, None if unknown
+    minimum: Optional[Version]
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_version(text: str) -> Optional[Version]:
+    """parse a single version, wildcards are treated as 0"""
+    match = VERSION.match(text.strip())
+    if not match:
+        return None
+    pre = match.group('pre')
+
+    def number(name):
+        value = match.group(name)
+        if value is None or not value.isdigit():
+            return 0
+        return int(value)
+
+    return Version(
+        number('major'), number('minor'), number('patch'),
+        tuple(pre.split('.')) if pre else ()
+    )
+
+
+def _parse_single(text: str) -> Constraint:
+    text = STABILITY.sub('', text.strip())
+    if text in ('*', 'x', 'X', ''):
+        return Constraint('wildcard', ZERO)
+    operator = ''
+    match = OPERATOR.match(text)
+    if match:
+        operator = match.group(1)
+        text = text[match.end():]
+    version = parse_version(text)
+    if version is None:
+        return Constraint('other', None)
+    if operator in ('<', '<=', '!='):
+        # No lower bound
+        return Constraint('range', ZERO)
+    if operator in ('>', '>='):
+        return Constraint('range', version)
+    if operator in OPERATOR_KINDS:
+        return Constraint(OPERATOR_KINDS[operator], version)
+    if re.search(r'\.[x*]', text, re.IGNORECASE) or '.' not in text:
+        # 1.x, 1.2.*, or just 1
+        return Constraint('wildcard', version)
+    return Constraint('exact', version)
+
+
+def _parse_conjunction(text: str) -> Constraint:
+    hyphen = HYPHEN_RANGE.match(text.strip())
+    if hyphen:
+        return Constraint('range', parse_version(hyphen.group(1)))
+    # composer uses "," or a space, npm uses a space; ignore spaces after operators
+    parts = [part for part in re.split(r'\s*,\s*|(?<![<>=~^!])\s+', text.strip()) if part]
+    if len(parts) <= 1:
+        return _parse_single(text)
+    minimums = []
+    for part in parts:
+        constraint = _parse_single(part)
+        if constraint.minimum is None:
+            return Constraint('other', None)
+        minimums.append(constraint.minimum)
+    # All of them have to be satisfied, so the highest lower bound wins
+    return Constraint('range', max(minimums, key=Version.sort_key))
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def parse_constraint(text: str) -> Constraint:
+    """parse a composer/npm/cargo version constraint"""
+    alternatives = [alt for alt in re.split(r'\|\|?', text) if alt.strip()]
+    if len(alternatives) <= 1:
+        return _parse_conjunction(text)
+    minimums = []
+    for alt in alternatives:
+        constraint = _parse_conjunction(alt)
+        if constraint.minimum is None:
+            return Constraint('other', None)
+        minimums.append(constraint.minimum)
+    # Any of them can be satisfied, so the lowest lower bound wins
+    return Constraint('alternatives', min(minimums, key=Version.sort_key))
+
+
+def columns(text: str) -> dict:
+    """the parsed Dependency columns for a version constraint"""
+    constraint = parse_constraint(text)
+    minimum = constraint.minimum
+    return {
+        'version_kind': constraint.kind,
+        'version_major': minimum.major if minimum else None,
+        'version_minor': minimum.minor if minimum else None,
+        'version_patch': minimum.patch if minimum else None,
+        'version_prerelease': bool(minimum.prerelease) if minimum else None,
+    }
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _constraint_key(text: str) -> Optional[tuple]:
+    minimum = parse_constraint(text).minimum
+    return minimum.sort_key() if minimum is not None else None
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def _version_key(text: str) -> Optional[tuple]:
+    version = parse_version(text)
+    return version.sort_key() if version is not None else None
+
+
+def _at_least(current: str, wanted: str, wanted_key: Optional[tuple]) -> bool:
+    if current == wanted:
+        return True
+    if current.startswith('file:'):
+        # Special npm syntax (see wdio-mediawiki in mediawiki/core)
+        return True
+    if wanted_key is None:
+        return False
+    key = _constraint_key(current)
+    return key is not None and key >= wanted_key
+
+
+def at_least(current: str, wanted: str) -> bool:
+    """
+    is the lowest version the current constraint allows at or above the
+    wanted version? Identical strings and npm "file:" dependencies
+    always are, unparseable constraints never are.
+    """
+    return _at_least(current, wanted, _version_key(wanted))
+
+
+def at_least_many(currents: Iterable[str], wanted: str) -> Dict[str, bool]:
+    """at_least() for many constraints against one wanted version, keyed by constraint"""
+    wanted_key = _version_key(wanted)
+    return {current: _at_least(current, wanted, wanted_key) for current in set(currents)}
@@ -16,20 +16,52 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 from collections import defaultdict, OrderedDict
-from flask import Flask, jsonify, render_template, make_response, request
-from flask_sqlalchemy import SQLAlchemy
+from datetime import timedelta
+from flask import Flask, has_request_context, jsonify, render_template, make_response, request
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+import json
 from markdown import markdown
-from sqlalchemy.orm import joinedload
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import contains_eager, joinedload, sessionmaker
 from sqlalchemy.sql.expression import func
+import threading
+import time
+import traceback
+from typing import Dict, Optional
+
+from . import MANAGERS, config, plan, simulate, utils
+from .db import replica_uri, sql_uri
+from .model import Advisory, Dependency, Dependencies, Log, Repository, Upstream
+
+# Bind key of the read-only replica
+REPLICA = 'replica'
+# How often to check replication lag, in seconds
+REPLICA_CHECK_INTERVAL = 30
+_replica_lock = threading.Lock()
+_replica_status = {'checked': 0.0, 'fresh': False}
+
+
+class RoutingSession(SignallingSession):
+    """sends the reads of GET requests to the replica, if there's a fresh one"""
+
+    def get_bind(self, mapper=None, clause=None):
+        if not self._flushing and use_replica():
+            return db.get_engine(self.app, bind=REPLICA)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
 
-from . import MANAGERS, config, plan, utils
-from .db import sql_uri
-from .model import Advisories, Dependency, Dependencies, Log, Repository, Upstream
 
 app = Flask(__name__)
 app.config['SQLALCHEMY_DATABASE_URI'] = sql_uri()
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = True
-db = SQLAlchemy(app)
+if replica_uri():
+    app.config['SQLALCHEMY_BINDS'] = {REPLICA: replica_uri()}
+db = RoutingSQLAlchemy(app)
 SEVERITIES = ['critical', 'high', 'moderate', 'low', 'info']
 # TODO: find some more colors?
 COLORS = ['danger', 'danger', 'warning', 'warning', 'info']
@@ -46,6 +78,49 @@ TABLE_PRESETS = {
 }
 
 
+def latest_log_time(engine) -> Optional[str]:
+    with engine.connect() as conn:
+        return conn.execute(select([Log.time]).order_by(Log.id.desc()).limit(1)).scalar()
+
+
+def replica_is_fresh() -> bool:
+    """
+    whether the replica is at most replica_max_lag seconds (from the
+    private config) behind the primary, going by the newest log. Only
+    checked every REPLICA_CHECK_INTERVAL seconds.
+    """
+    with _replica_lock:
+        now = time.monotonic()
+        if now - _replica_status['checked'] < REPLICA_CHECK_INTERVAL:
+            return bool(_replica_status['fresh'])
+        max_lag = timedelta(seconds=config.private().get('replica_max_lag', 300))
+        try:
+            primary = latest_log_time(db.engine)
+            replica = latest_log_time(db.get_engine(app, bind=REPLICA))
+        except SQLAlchemyError:
+            traceback.print_exc()
+            fresh = False
+        else:
+            if primary is None or primary == replica:
+                fresh = True
+            elif replica is None:
+                fresh = False
+            else:
+                fresh = utils.from_mw_time(primary) - utils.from_mw_time(replica) <= max_lag
+        _replica_status['checked'] = now
+        _replica_status['fresh'] = fresh
+        return fresh
+
+
+def use_replica() -> bool:
+    """only GET requests read from the replica, everything else needs the primary"""
+    if not has_request_context() or request.method not in ('GET', 'HEAD'):
+        return False
+    if REPLICA not in (app.config.get('SQLALCHEMY_BINDS') or {}):
+        return False
+    return replica_is_fresh()
+
+
 @app.context_processor
 def inject_to_templates():
     return {
@@ -69,7 +144,7 @@ def index():
     count = db.session.query(Repository).count()
     upstreams = db.session.query(Upstream).count()
     recent_logs = db.session.query(Log)\
-        .options(joinedload(Log.repository))\
+        .options(Log.summary(), joinedload(Log.repository))\
         .order_by(Log.id.desc())\
         .limit(15).all()
     return render_template('index.html', count=count, upstreams=upstreams, recent_logs=recent_logs)
@@ -92,6 +167,7 @@ def r(repo):
     dependencies = Dependencies(repository.dependencies)
     logs = db.session.query(Log)\
         .filter_by(repo_id=repository.id)\
+        .options(Log.summary())\
         .order_by(Log.id.desc())\
         .limit(10).all()
     return render_template(
@@ -197,13 +273,16 @@ def library_(manager, name):
         .first()
     if upstream is None:
         upstream = Upstream(manager=manager, name=name, description=b'Unknown', latest='0.0.0')
-    safe_version = plan.Plan(branch=branch).safe_version(manager, name)
+    plan_ = plan.Plan(branch=branch)
+    safe_version = plan_.safe_version(manager, name)
+    rollout = plan_.rollout(db.session, manager, name)
 
     return render_template(
         'library.html',
         used=used,
         upstream=upstream,
         safe_version=safe_version,
+        rollout=rollout,
     )
 
 
@@ -232,77 +311,42 @@ def errors():
     return render_template('errors.html', repos=repos)
 
 
-@app.get('/vulns/composer')
-def vulns_composer():
-    branch = request_branch()
-    everything = db.session.query(Advisories)\
+def advisories_for(manager: str, branch: str) -> dict:
+    """advisory_id -> {info, package, repos} for all repositories on the branch"""
+    rows = db.session.query(Advisory)\
         .join(Repository)\
-        .filter(Advisories.manager == "composer", Repository.branch == branch)\
-        .options(joinedload(Advisories.repository))\
+        .filter(Advisory.manager == manager, Repository.branch == branch)\
+        .options(contains_eager(Advisory.repository))\
         .all()
-    advisories = {}
-
-    def make_key(pkg, dtls):
-        """A unique ID for each advisory"""
-        if dtls.get('cve'):
-            # CVE should be unique
-            return dtls['cve']
+    advisories: Dict[str, dict] = {}
+    for row in rows:
+        if row.advisory_id in advisories:
+            advisories[row.advisory_id]['repos'].append(row.repository)
         else:
-            # Hopefully this combo is unique enough
-            return f"{pkg}-{dtls['title']}-{dtls['link']}"
-
-    for obj in everything:
-        report = obj.get_data()
-        for package, details in report.items():
-            for advisory in details['advisories']:
-                key = make_key(package, advisory)
-                if key in advisories:
-                    advisories[key]['repos'].append(obj.repository)
-                else:
-                    advisories[key] = {
-                        'info': advisory,
-                        'package': package,
-                        'repos': [obj.repository]
-                    }
+            advisories[row.advisory_id] = {
+                'info': row.get_info(),
+                'package': row.package,
+                'severity': row.severity,
+                'repos': [row.repository],
+            }
+    return advisories
+
 
+@app.get('/vulns/composer')
+def vulns_composer():
+    branch = request_branch()
     return render_template(
         'vulns_composer.html',
-        advisories=advisories,
+        advisories=advisories_for("composer", branch),
     )
 
 
 @app.get('/vulns/npm')
 def vulns_npm():
     branch = request_branch()
-    everything = db.session.query(Advisories)\
-        .join(Repository)\
-        .filter(Advisories.manager == "npm", Repository.branch == branch)\
-        .options(joinedload(Advisories.repository))\
-        .all()
-    advisories = {}
-    for obj in everything:
-        report = obj.get_data()
-        if 'error' in report:
-            # TODO: Use proper logging
-            print(obj.repository.name, report)
-            continue
-        if report.get("auditReportVersion") != 2:
-            # old npm v6 report
-            continue
-        for info in report["vulnerabilities"].values():
-            for via in info["via"]:
-                if type(via) == dict:
-                    if via["source"] in advisories:
-                        advisories[via["source"]]["repos"].append(obj.repository)
-                    else:
-                        advisories[via["source"]] = {
-                            "info": via,
-                            "repos": [obj.repository],
-                        }
-
     advisories = OrderedDict(sorted(
-        advisories.items(),
-        key=lambda x: (SEVERITIES.index(x[1]["info"]['severity']), x[0])
+        advisories_for("npm", branch).items(),
+        key=lambda x: (SEVERITIES.index(x[1]['severity']), x[0])
     ))
 
     return render_template(
@@ -323,6 +367,28 @@ def status():
     )
 
 
+@app.route('/simulate', methods=('GET', 'POST'))
+def simulate_():
+    """what-if for a candidate releases.json"""
+    branch = request_branch()
+    result = None
+    error = None
+    if request.method == 'POST':
+        text = request.form.get('releases', '')
+        try:
+            result = simulate.simulate(db.session, branch, simulate.parse_releases(text))
+        except ValueError as e:
+            error = str(e)
+    else:
+        text = json.dumps(config.releases(), indent=4)
+    return render_template(
+        'simulate.html',
+        text=text,
+        result=result,
+        error=error,
+    )
+
+
 @app.route('/plan.json', methods=('GET', 'POST'))
 def plan_json():
     """Keep in sync with HTTPPlan"""
@@ -358,6 +424,33 @@ def plan_json():
     )
 
 
+@app.route('/plan_batch.json', methods=('GET', 'POST'))
+def plan_batch_json():
+    """
+    Plans for many repositories at once: the given "repository"
+    parameters (may be repeated), or every repository of the branch
+    """
+    branch = request.args.get('branch')
+    if not branch:
+        return jsonify(
+            status="error",
+            error="Missing branch parameter")
+    branch = utils.normalize_branch(branch)
+    branches = config.branches()
+    if branch not in branches:
+        return jsonify(
+            status="error",
+            error="Invalid branch specified. Choose one of: " + ', '.join(branches)
+        )
+    repos = request.args.getlist('repository') or None
+    # If it was a POST request, git pull
+    planner = plan.Plan(branch, pull=request.method == 'POST')
+    return jsonify(
+        status="ok",
+        plans=planner.check_many(db.session, repos)
+    )
+
+
 @app.route('/metrics')
 def metrics():
     max_log = db.session.query(func.max(Log.id)).scalar()
@@ -27,7 +27,7 @@ import shutil
 import subprocess
 import tempfile
 import traceback
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from xml.etree import ElementTree
 
 from pathlib import Path
@@ -1295,7 +1295,15 @@ class LibraryUpgrader(shell2.ShellMixin):
     def is_main(self):
         return self.git_branch in ("main", "master")
 
-    def run(self, repo, output, branch):
+    def get_plan(self, repo: str, plan: Optional[str] = None) -> list:
+        """the plan precomputed by libup if there is one, otherwise ask the web service"""
+        if plan is not None:
+            with open(plan) as f:
+                return json.load(f)
+        planner = HTTPPlan(branch=self.git_branch)
+        return planner.check(repo)
+
+    def run(self, repo, output, branch, plan=None):
         self.output = SaveDict({
             'repo': repo,
             'log': [],
@@ -1333,10 +1341,9 @@ class LibraryUpgrader(shell2.ShellMixin):
         self.fix_package_json_metadata(repo)
 
         # Try upgrades
-        planner = HTTPPlan(branch=self.git_branch)
-        plan = planner.check(repo)
-        self.npm_upgrade(plan)
-        self.composer_upgrade(plan)
+        upgrades = self.get_plan(repo, plan)
+        self.npm_upgrade(upgrades)
+        self.composer_upgrade(upgrades)
 
         # Re-run npm audit since upgrades might change stuff
         new_npm_audit = self.npm_audit()
@@ -1394,10 +1401,11 @@ def main():
     parser.add_argument('repo', help='Git repository')
     parser.add_argument('output', help='Path to output results to')
     parser.add_argument('--branch', help='Git branch', default='master')
+    parser.add_argument('--plan', help='Path to the precomputed update plan (JSON)')
     args = parser.parse_args()
     libup = LibraryUpgrader()
     try:
-        libup.run(args.repo, args.output, args.branch)
+        libup.run(args.repo, args.output, args.branch, plan=args.plan)
     except:  # noqa
         # Make sure we log all exceptions that bubble up
         libup.log(traceback.format_exc())
@@ -16,6 +16,11 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import requests
+import time
+
+# Attempts at fetching the plan, with exponential backoff between them
+ATTEMPTS = 5
+BACKOFF = 2
 
 
 class HTTPPlan:
@@ -24,8 +29,10 @@ class HTTPPlan:
         self.branch = branch
 
     def check(self, repo: str) -> list:
-        # Retry this up to 5 times
-        for _ in range(5):
+        for attempt in range(ATTEMPTS):
+            if attempt:
+                # Wait 2, 4, 8, ... seconds
+                time.sleep(BACKOFF ** attempt)
             resp = requests.post(
                 'https://libraryupgrader2.wmcloud.org/plan.json',
                 params={
@@ -0,0 +1,43 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import pytest
+
+from runner.httpplan import HTTPPlan
+
+
+def test_check_backoff(mocker):
+    sleep = mocker.patch('runner.httpplan.time.sleep')
+    error = mocker.Mock(ok=False)
+    error.raise_for_status.side_effect = RuntimeError('500')
+    ok = mocker.Mock(ok=True)
+    ok.json.return_value = {'status': 'ok', 'plan': [['npm', 'eslint', '8.0.0', 5]]}
+    post = mocker.patch('runner.httpplan.requests.post', side_effect=[error, error, ok])
+    assert HTTPPlan('master').check('test/ok') == [['npm', 'eslint', '8.0.0', 5]]
+    assert post.call_count == 3
+    assert [call.args for call in sleep.call_args_list] == [(2,), (4,)]
+
+
+def test_check_gives_up(mocker):
+    sleep = mocker.patch('runner.httpplan.time.sleep')
+    error = mocker.Mock(ok=False)
+    error.raise_for_status.side_effect = RuntimeError('500')
+    post = mocker.patch('runner.httpplan.requests.post', return_value=error)
+    with pytest.raises(RuntimeError):
+        HTTPPlan('master').check('test/ok')
+    assert post.call_count == 5
+    assert sleep.call_count == 4
@@ -905,3 +905,16 @@ manager2:
 Additional changes:
 * Fixed one more thing
 """
+
+
+def test_get_plan(tempfs, mocker):
+    libup = LibraryUpgrader()
+    libup.git_branch = 'master'
+    http = mocker.patch('runner.HTTPPlan')
+    tempfs.create_file('plan.json', contents='[["npm", "eslint", "8.0.0", 5]]')
+    assert libup.get_plan('test/ok', 'plan.json') == [['npm', 'eslint', '8.0.0', 5]]
+    http.assert_not_called()
+    # No precomputed plan, fall back to the web service
+    http.return_value.check.return_value = []
+    assert libup.get_plan('test/ok') == []
+    http.assert_called_once_with(branch='master')
@@ -13,8 +13,10 @@ setup(
     entry_points={
         'console_scripts': [
             'libup-celery = libup.tasks:main',
+            'libup-maint = libup.maintenance:main',
             'libup-ng = libup.ng:main',
             'libup-run = libup.run:main',
+            'libup-simulate = libup.simulate:main',
         ]
     }
 
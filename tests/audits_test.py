@@ -0,0 +1,70 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from libup import audits
+
+NPM_REPORT = {
+    "auditReportVersion": 2,
+    "vulnerabilities": {
+        "minimist": {
+            "name": "minimist",
+            "severity": "critical",
+            "via": [{"source": 1179, "name": "minimist", "severity": "critical", "title": "Prototype Pollution",
+                     "url": "https://github.com/advisories/GHSA-vh95-rmgr-6w4m"}],
+        },
+        "mkdirp": {
+            "name": "mkdirp",
+            "severity": "critical",
+            # Transitive, reported through minimist
+            "via": ["minimist", {"source": 1179, "name": "minimist", "severity": "critical",
+                                 "title": "Prototype Pollution",
+                                 "url": "https://github.com/advisories/GHSA-vh95-rmgr-6w4m"}],
+        },
+    },
+}
+COMPOSER_REPORT = {
+    "guzzlehttp/psr7": {
+        "version": "1.8.3",
+        "advisories": [
+            {"title": "Improper header validation", "link": "https://example.org/1", "cve": "CVE-2022-24775"},
+            {"title": "Something else", "link": "https://example.org/2", "cve": ""},
+        ],
+    },
+}
+
+
+def test_parse_npm():
+    entries = audits.parse("npm", NPM_REPORT)
+    assert len(entries) == 1
+    assert entries[0]["advisory_id"] == "1179"
+    assert entries[0]["package"] == "minimist"
+    assert entries[0]["severity"] == "critical"
+    assert entries[0]["info"]["title"] == "Prototype Pollution"
+    assert audits.parse("npm", {"error": "something broke"}) == []
+    # npm v6
+    assert audits.parse("npm", {"advisories": {}}) == []
+
+
+def test_parse_composer():
+    entries = audits.parse("composer", COMPOSER_REPORT)
+    assert [entry["advisory_id"] for entry in entries] == [
+        "CVE-2022-24775",
+        audits.composer_key("guzzlehttp/psr7", COMPOSER_REPORT["guzzlehttp/psr7"]["advisories"][1]),
+    ]
+    assert entries[1]["advisory_id"].startswith("sha1:")
+    assert entries[1]["package"] == "guzzlehttp/psr7"
+    assert audits.parse("cargo", {}) == []
@@ -0,0 +1,87 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import os
+import pytest
+
+from libup import blobstore, maintenance, model
+
+
+@pytest.fixture
+def blobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(blobstore.config, "private", lambda: {"blob_store": str(tmp_path)})
+    return blobstore.get_store()
+
+
+def test_filesystem_store(tmp_path):
+    store = blobstore.FilesystemBlobStore(tmp_path)
+    key = blobstore.digest("foobarbaz")
+    assert store.exists(key) is False
+    store.put(key, b"foobarbaz")
+    assert store.path(key) == tmp_path / key[:2] / key[2:4] / key
+    assert store.get(key) == b"foobarbaz"
+    # Storing it again only marks it as recently stored
+    os.utime(store.path(key), (0, 0))
+    store.put(key, b"foobarbaz")
+    assert store.last_stored(key) > 0
+    store.delete(key)
+    assert store.exists(key) is False
+    assert store.last_stored(key) is None
+
+
+def test_store_without_blob_store(monkeypatch):
+    monkeypatch.setattr(blobstore.config, "private", lambda: {})
+    assert blobstore.store("foobarbaz") == b"foobarbaz"
+    assert blobstore.load(b"foobarbaz") == "foobarbaz"
+    with pytest.raises(RuntimeError):
+        blobstore.load(blobstore.PREFIX + blobstore.digest("foobarbaz").encode())
+    # Inline text that happens to look like a reference
+    assert blobstore.load(blobstore.store("b:" + blobstore.digest("foobarbaz"))) == \
+        "b:" + blobstore.digest("foobarbaz")
+
+
+def test_log_uses_blob_store(blobs):
+    first = model.Log()
+    first.set_text("foobarbaz")
+    first.set_patch("AAAA" * 999999)
+    assert first.text == blobstore.PREFIX + blobstore.digest("foobarbaz").encode()
+    assert first.get_text() == "foobarbaz"
+    assert first.get_patch() == "AAAA" * 999999
+    # Stored compressed
+    assert blobs.get(blobstore.digest("AAAA" * 999999)).startswith(b"l:")
+    # Identical content is only stored once
+    second = model.Log()
+    second.set_text("foobarbaz")
+    assert second.text == first.text
+
+
+def test_migrate_blobs(tmp_path, monkeypatch, session):
+    for i in range(3):
+        log = model.Log(time="20220209000000")
+        log.set_text(f"log {i}")
+        log.set_patch("a patch" if i else None)
+        session.add(log)
+    session.commit()
+    monkeypatch.setattr(blobstore.config, "private", lambda: {"blob_store": str(tmp_path)})
+    assert maintenance.migrate_blobs(session, batch_size=2) == 3
+    logs = session.query(model.Log).order_by(model.Log.id).all()
+    assert all(blobstore.is_reference(log.text) for log in logs)
+    assert [log.get_text() for log in logs] == ["log 0", "log 1", "log 2"]
+    assert logs[0].patch is None
+    assert logs[2].get_patch() == "a patch"
+    # Nothing left to do
+    assert maintenance.migrate_blobs(session) == 0
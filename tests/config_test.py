@@ -0,0 +1,59 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import json
+import os
+import pytest
+
+from libup import config
+
+
+@pytest.fixture
+def config_repo(tmp_path, monkeypatch):
+    releases = tmp_path / "releases.json"
+    releases.write_text(json.dumps({"version": 2, "push": False}))
+    monkeypatch.setattr(config, "RELEASES", str(releases))
+    monkeypatch.setattr(config, "CONFIG_REPO", str(tmp_path))
+    monkeypatch.setattr(config, "_cache", {})
+    monkeypatch.setattr(config, "_last_pull", 0.0)
+    yield releases
+
+
+def test_releases_cached(config_repo):
+    first = config.releases()
+    assert first == {"version": 2, "push": False}
+    assert config.releases() is first
+    config_repo.write_text(json.dumps({"version": 2, "push": True}))
+    # Make sure the mtime changes even on coarse filesystems
+    stat = os.stat(config_repo)
+    os.utime(config_repo, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert config.releases() == {"version": 2, "push": True}
+
+
+def test_pull_coalesced(config_repo, mocker):
+    check_call = mocker.patch("libup.config.subprocess.check_call")
+    monotonic = mocker.patch("libup.config.time.monotonic", return_value=1000.0)
+    config.ensure(pull=True)
+    config.ensure(pull=True)
+    check_call.assert_called_once_with(["git", "pull"], cwd=str(config_repo.parent))
+    monotonic.return_value += config.PULL_INTERVAL
+    config.ensure(pull=True)
+    assert check_call.call_count == 2
+    # Not pulling doesn't touch git
+    config.ensure()
+    assert check_call.call_count == 2
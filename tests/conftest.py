@@ -0,0 +1,32 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+
+from libup import model
+
+
+@pytest.fixture
+def session():
+    """A session on a fresh in-memory database"""
+    engine = create_engine("sqlite://")
+    model.Base.metadata.create_all(engine)
+    with Session(engine) as session:
+        yield session
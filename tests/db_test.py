@@ -0,0 +1,284 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+import pytest
+import requests
+
+from libup import db, metadata, model
+
+
+@pytest.fixture
+def session(session):
+    session.add(model.Repository(name="test/one", branch="main"))
+    session.add(model.Repository(name="test/two", branch="main"))
+    session.commit()
+    return session
+
+
+def versions(session, repo_id: int) -> dict:
+    return {
+        dep.key(): dep.version
+        for dep in session.query(model.Dependency).filter_by(repo_id=repo_id)
+    }
+
+
+@pytest.fixture
+def fresh_engine(monkeypatch):
+    monkeypatch.setattr(db, "_engine", None)
+    monkeypatch.setattr(db, "_engine_pid", None)
+    monkeypatch.setattr(db.config, "private", lambda: {"pool_size": 2, "pool_recycle": 60})
+
+
+def test_engine_options(fresh_engine):
+    assert db.engine_options() == {
+        "pool_pre_ping": True,
+        "pool_size": 2,
+        "max_overflow": 10,
+        "pool_recycle": 60,
+    }
+
+
+def test_sqlite(fresh_engine, monkeypatch, tmp_path):
+    path = tmp_path / "libup.db"
+    monkeypatch.setattr(db.config, "private", lambda: {"sqlite_path": str(path)})
+    assert db.sql_uri() == f"sqlite:///{path}"
+    assert db.engine_options() == {}
+    engine = db.get_engine()
+    assert db.create_schema(engine) is True
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA foreign_keys").scalar() == 1
+        revision = conn.exec_driver_sql("SELECT version_num FROM alembic_version").scalar()
+    with db.session_scope() as session:
+        session.add(model.Repository(name="test/one", branch="main"))
+    with db.session_scope() as session:
+        assert session.query(model.Repository).count() == 1
+    # Already set up
+    assert db.create_schema(engine) is False
+    # Stamped with the latest migration
+    cfg = Config()
+    cfg.set_main_option("script_location", db.ALEMBIC_DIR)
+    assert revision == ScriptDirectory.from_config(cfg).get_current_head()
+
+
+def test_get_engine_reused(fresh_engine, mocker):
+    create_engine = mocker.patch("libup.db.create_engine")
+    first = db.get_engine()
+    assert db.connect() is first
+    assert db.get_engine() is first
+    create_engine.assert_called_once_with(db.sql_uri(), **db.engine_options())
+
+
+def test_get_engine_after_fork(fresh_engine, mocker):
+    mocker.patch("libup.db.create_engine", side_effect=lambda *args, **kwargs: object())
+    first = db.get_engine()
+    # Pretend we're now in a forked child process
+    mocker.patch("libup.db.os.getpid", return_value=db._engine_pid + 1)
+    assert db.get_engine() is not first
+
+
+def test_session_scope(fresh_engine, mocker):
+    mocker.patch("libup.db.get_engine")
+    session = mocker.MagicMock()
+    mocker.patch("libup.db.Session", return_value=session)
+    with db.session_scope() as scoped:
+        assert scoped is session
+    session.commit.assert_called_once()
+    session.close.assert_called_once()
+    session.reset_mock()
+    with pytest.raises(ValueError):
+        with db.session_scope():
+            raise ValueError()
+    session.commit.assert_not_called()
+    session.rollback.assert_called_once()
+    session.close.assert_called_once()
+
+
+def test_update_dependencies(session):
+    repo = session.query(model.Repository).filter_by(name="test/one").first()
+    db.update_dependencies(session, repo, [
+        model.Dependency(name="eslint", version="7.0.0", manager="npm", mode="dev"),
+        model.Dependency(name="mediawiki/minus-x", version="1.0.0", manager="composer", mode="dev"),
+    ])
+    assert len(repo.dependencies) == 2
+    db.update_dependencies(session, repo, [
+        model.Dependency(name="eslint", version="8.0.0", manager="npm", mode="dev"),
+        model.Dependency(name="grunt", version="1.0.0", manager="npm", mode="dev"),
+    ])
+    assert versions(session, repo.id) == {
+        "dev:npm:eslint": "8.0.0",
+        "dev:npm:grunt": "1.0.0",
+    }
+    # The relationship was refreshed too
+    assert sorted(dep.name for dep in repo.dependencies) == ["eslint", "grunt"]
+
+
+def test_sync_dependencies(session):
+    # Pre-existing duplicate rows get cleaned up
+    session.add_all([
+        model.Dependency(name="eslint", version="6.0.0", manager="npm", mode="dev", repo_id=1),
+        model.Dependency(name="eslint", version="6.0.0", manager="npm", mode="dev", repo_id=1),
+        model.Dependency(name="serde", version="1.0", manager="cargo", mode="prod", repo_id=2),
+    ])
+    session.commit()
+    db.sync_dependencies(session, {
+        1: [model.Dependency(name="eslint", version="7.0.0", manager="npm", mode="dev")],
+        2: [
+            model.Dependency(name="serde", version="1.0", manager="cargo", mode="prod"),
+            # Listed twice, the last one wins
+            model.Dependency(name="toml", version="0.4", manager="cargo", mode="prod"),
+            model.Dependency(name="toml", version="0.5", manager="cargo", mode="prod"),
+        ],
+    })
+    session.commit()
+    assert versions(session, 1) == {"dev:npm:eslint": "7.0.0"}
+    assert session.query(model.Dependency).filter_by(repo_id=1).count() == 1
+    assert versions(session, 2) == {"prod:cargo:serde": "1.0", "prod:cargo:toml": "0.5"}
+    # Parsed version columns are written for inserts and updates
+    eslint = session.query(model.Dependency).filter_by(repo_id=1).one()
+    assert (eslint.version_major, eslint.version_minor, eslint.version_kind) == (7, 0, "exact")
+    toml = session.query(model.Dependency).filter_by(repo_id=2, name="toml").one()
+    assert (toml.version_major, toml.version_minor) == (0, 5)
+    # Nothing extracted means everything is removed
+    db.sync_dependencies(session, {2: []})
+    session.commit()
+    assert versions(session, 2) == {}
+
+
+def test_dependency_changes(session):
+    db.sync_dependencies(session, {1: [
+        model.Dependency(name="eslint", version="7.0.0", manager="npm", mode="dev"),
+        model.Dependency(name="grunt", version="1.0.0", manager="npm", mode="dev"),
+    ]})
+    db.sync_dependencies(session, {1: [
+        model.Dependency(name="eslint", version="8.0.0", manager="npm", mode="dev"),
+    ]})
+    db.sync_dependencies(session, {2: [
+        model.Dependency(name="eslint", version="8.0.0", manager="npm", mode="dev"),
+    ]})
+    log = model.Log(repo_id=1, time="20220219000000")
+    log.set_text("foo")
+    session.add(log)
+    session.flush()
+    db.link_dependency_changes(session, 1, log.id)
+    session.commit()
+    assert [(change.repo_id, change.old, change.new, change.log_id)
+            for change in db.package_history(session, "npm", "eslint")] == [
+        (1, None, "7.0.0", log.id),
+        (1, "7.0.0", "8.0.0", log.id),
+        (2, None, "8.0.0", None),
+    ]
+    assert [(change.name, change.old, change.new) for change in db.repository_history(session, 1, limit=2)] == [
+        ("grunt", "1.0.0", None),
+        ("eslint", "7.0.0", "8.0.0"),
+    ]
+    assert db.package_history(session, "npm", "eslint", since="29990101000000") == []
+
+
+def test_sync_advisories(session):
+    report = {
+        "guzzlehttp/psr7": {
+            "version": "1.8.3",
+            "advisories": [
+                {"title": "Improper header validation", "link": "https://example.org", "cve": "CVE-2022-24775"},
+            ],
+        },
+    }
+    db.sync_advisories(session, 1, "composer", report)
+    db.sync_advisories(session, 2, "composer", report)
+    session.commit()
+    rows = session.query(model.Advisory).filter_by(advisory_id="CVE-2022-24775").all()
+    assert sorted(row.repo_id for row in rows) == [1, 2]
+    assert rows[0].get_info()["title"] == "Improper header validation"
+    # Fixed in one repository
+    db.sync_advisories(session, 1, "composer", None)
+    session.commit()
+    assert [row.repo_id for row in session.query(model.Advisory).all()] == [2]
+
+
+def test_update_upstreams(session, mocker):
+    session.add_all([
+        model.Dependency(name="eslint", version="7.0.0", manager="npm", mode="dev", repo_id=1),
+        model.Dependency(name="eslint", version="8.0.0", manager="npm", mode="dev", repo_id=2),
+        model.Dependency(name="serde", version="1.0", manager="cargo", mode="prod", repo_id=2),
+        model.Upstream(manager="npm", name="eslint", description=b"old", latest="7.0.0"),
+    ])
+    session.commit()
+    mocker.patch("libup.metadata.packagist_changes", return_value=(None, None))
+    get_many = mocker.patch("libup.metadata.get_many_metadata", return_value={
+        ("npm", "eslint"): {"latest": "8.1.0", "description": "linter"},
+        ("cargo", "serde"): {"latest": "1.0.136", "description": "serialization"},
+    })
+    db.update_upstreams(session)
+    # Each package is only fetched once
+    assert sorted(get_many.call_args.args[0]) == [("cargo", "serde"), ("npm", "eslint")]
+    assert sorted((up.manager, up.name, up.latest, up.get_description())
+                  for up in session.query(model.Upstream)) == [
+        ("cargo", "serde", "1.0.136", "serialization"),
+        ("npm", "eslint", "8.1.0", "linter"),
+    ]
+
+
+def test_update_upstreams_packagist_changes(session, mocker):
+    session.add_all([
+        model.Dependency(name="psr/log", version="1.0.0", manager="composer", mode="prod", repo_id=1),
+        model.Dependency(name="monolog/monolog", version="2.0.0", manager="composer", mode="prod", repo_id=1),
+        model.Dependency(name="guzzlehttp/guzzle", version="7.0.0", manager="composer", mode="prod", repo_id=1),
+        model.Upstream(manager="composer", name="psr/log", description=b"PSR-3", latest="1.0.0"),
+        model.Upstream(manager="composer", name="monolog/monolog", description=b"Logging", latest="2.0.0"),
+    ])
+    session.commit()
+    mocker.patch("libup.metadata.load_packagist_cursor", return_value=(100, set()))
+    mocker.patch("libup.metadata.packagist_changes", return_value=({"monolog/monolog"}, 200))
+    save = mocker.patch("libup.metadata.save_packagist_cursor")
+    # Fetching monolog fails
+    get_many = mocker.patch("libup.metadata.get_many_metadata", return_value={
+        ("composer", "guzzlehttp/guzzle"): {"latest": "7.4.0", "description": "HTTP client"},
+    })
+    db.update_upstreams(session)
+    # psr/log is known and didn't change, guzzle is new
+    assert sorted(get_many.call_args.args[0]) == [
+        ("composer", "guzzlehttp/guzzle"), ("composer", "monolog/monolog")
+    ]
+    save.assert_called_once_with(200, {"monolog/monolog"})
+
+    # Next time, monolog is refetched even though it didn't change again
+    mocker.patch("libup.metadata.load_packagist_cursor", return_value=(200, {"monolog/monolog"}))
+    mocker.patch("libup.metadata.packagist_changes", return_value=(set(), 300))
+    db.update_upstreams(session)
+    assert get_many.call_args.args[0] == [("composer", "monolog/monolog")]
+
+
+def test_update_upstreams_packagist_error(session, mocker):
+    session.add_all([
+        model.Dependency(name="monolog/monolog", version="2.0.0", manager="composer", mode="prod", repo_id=1),
+        model.Upstream(manager="composer", name="monolog/monolog", description=b"Logging", latest="3.0.0"),
+    ])
+    session.commit()
+    mocker.patch("libup.metadata.load_packagist_cursor", return_value=(100, set()))
+    mocker.patch("libup.metadata.packagist_changes", return_value=({"monolog/monolog"}, 200))
+    save = mocker.patch("libup.metadata.save_packagist_cursor")
+    resp = requests.Response()
+    resp.status_code = 503
+    mocker.patch("libup.metadata.get_composer_metadata",
+                 side_effect=lambda name: metadata.parse_composer_metadata(name, resp))
+    db.update_upstreams(session)
+    # Left alone and retried next time
+    assert session.query(model.Upstream).one().latest == "3.0.0"
+    save.assert_called_once_with(200, {"monolog/monolog"})
@@ -0,0 +1,80 @@
+"""
+Copyright (C) 2020 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import io
+import pytest
+import requests
+
+from libup import httpcache
+
+
+def response(status=200, body=b'{"latest": "1.0.0"}', headers=None):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.raw = io.BytesIO(body)
+    resp.headers.update(headers or {})
+    return resp
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return httpcache.HTTPCache(str(tmp_path / "http.sqlite3"), ttl=60)
+
+
+def test_get(cache, mocker):
+    get = mocker.patch("libup.httpcache.session.get", return_value=response(headers={"ETag": '"abc"'}))
+    wait = mocker.Mock()
+    parse = mocker.Mock(side_effect=lambda r: r.json())
+    assert cache.get("https://example.org/a", parse, wait=wait) == {"latest": "1.0.0"}
+    # Fresh, no request at all
+    assert cache.get("https://example.org/a", parse, wait=wait) == {"latest": "1.0.0"}
+    assert get.call_count == 1
+    assert wait.call_count == 1
+    # Stale, revalidated with a conditional request
+    mocker.patch("libup.httpcache.time.time", return_value=httpcache.time.time() + 120)
+    get.return_value = response(status=304, body=b'')
+    assert cache.get("https://example.org/a", parse, wait=wait) == {"latest": "1.0.0"}
+    assert get.call_args.kwargs["headers"] == {"If-None-Match": '"abc"'}
+    assert parse.call_count == 1
+    # The 304 counts as a fresh fetch
+    assert cache.get("https://example.org/a", parse) == {"latest": "1.0.0"}
+    assert get.call_count == 2
+
+
+def test_get_error(cache, mocker):
+    get = mocker.patch("libup.httpcache.session.get", return_value=response(status=404, body=b''))
+    for _ in range(2):
+        assert cache.get("https://example.org/missing", lambda r: {"status": r.status_code}) == {"status": 404}
+    # Errors aren't cached
+    assert get.call_count == 2
+
+
+def test_evict(tmp_path, mocker):
+    cache = httpcache.HTTPCache(str(tmp_path / "http.sqlite3"), max_bytes=100)
+    mocker.patch("libup.httpcache.session.get", return_value=response(body=b'"' + b'x' * 30 + b'"'))
+    clock = mocker.patch("libup.httpcache.time.time", return_value=1000.0)
+    for name in "abc":
+        clock.return_value += 1
+        cache.get(f"https://example.org/{name}", lambda r: r.json())
+    # Use "a" again, so "b" is the least recently used
+    clock.return_value += 1
+    cache.get("https://example.org/a", lambda r: r.json())
+    clock.return_value += 1
+    cache.get("https://example.org/d", lambda r: r.json())
+    urls = {row[0] for row in cache.conn.execute("SELECT url FROM responses")}
+    assert urls == {"https://example.org/a", "https://example.org/d"}
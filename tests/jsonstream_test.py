@@ -0,0 +1,64 @@
+"""
+Copyright (C) 2020 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import json
+import pytest
+
+from libup import jsonstream
+
+DOC = {
+    "_id": "eslint",
+    "versions": {
+        "1.0.0": {"deps": [1, 2.5, True, None, "a\\\"b}{]["], "x": {"y": "z\\\\"}},
+        "2.0.0": {"description": "ünïcode"},
+    },
+    "count": -12.5e3,
+    "dist-tags": {"latest": "8.9.0"},
+    "description": "An AST-based \"pattern\" checker",
+    "after": [1, 2, 3],
+}
+
+
+def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@pytest.mark.parametrize('size', (1, 2, 3, 7, 4096))
+@pytest.mark.parametrize('indent', (None, 2))
+def test_read_keys(size, indent):
+    raw = json.dumps(DOC, indent=indent, ensure_ascii=False).encode()
+    assert jsonstream.read_keys(chunked(raw, size), {"dist-tags", "description", "count", "missing"}) == {
+        "dist-tags": {"latest": "8.9.0"},
+        "description": DOC["description"],
+        "count": -12.5e3,
+    }
+
+
+def test_read_keys_stops_early():
+    raw = json.dumps(DOC).encode()
+    chunks = chunked(raw, 8)
+    assert jsonstream.read_keys(chunks, {"_id"}) == {"_id": "eslint"}
+    # The rest was never read
+    assert len(b"".join(chunks)) >= len(raw) - 24
+
+
+@pytest.mark.parametrize('raw', (b'[1, 2]', b'{"a": [1, 2', b'{"a": '))
+def test_read_keys_invalid(raw):
+    with pytest.raises(ValueError):
+        jsonstream.read_keys(chunked(raw, 3), {"b"})
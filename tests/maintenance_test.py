@@ -0,0 +1,146 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import pytest
+import time
+
+from libup import blobstore, maintenance, model, utils
+
+
+@pytest.fixture
+def session(session):
+    session.add(model.Repository(id=1, name="test/example", branch="main"))
+    session.commit()
+    return session
+
+
+@pytest.fixture
+def zstd_dir(tmp_path, monkeypatch):
+    pytest.importorskip("zstandard")
+    monkeypatch.setattr(utils, "ZSTD_DICTIONARIES", str(tmp_path))
+    utils.current_zstd_dictionary_id.cache_clear()
+    yield tmp_path
+    utils.current_zstd_dictionary_id.cache_clear()
+
+
+def test_train_zstd(session, zstd_dir):
+    for i in range(300):
+        log = model.Log(repo_id=1, time="20220210000000")
+        log.set_text(f"$ composer update\nLoading composer repositories with package information\n"
+                     f"Updating dependencies\nLock file operations: {i} installs, {i % 5} updates, 0 removals\n")
+        session.add(log)
+    session.commit()
+    dict_id = maintenance.train_zstd(session, samples=250, size=8192)
+    assert utils.current_zstd_dictionary_id() == dict_id
+    assert utils.maybe_compress("Updating dependencies").startswith(utils.ZSTD_PREFIX)
+    # Logs from before training are still readable
+    assert session.query(model.Log).first().get_text().startswith("$ composer update")
+
+
+def test_backfill_digests(session):
+    for patch in (None, "a patch"):
+        log = model.Log(repo_id=1, time="20220212000000")
+        log.set_text("foobarbaz")
+        log.set_patch(patch)
+        # Pretend these were stored before digests were
+        log.text_sha256 = log.text_size = log.patch_sha256 = log.patch_size = None
+        session.add(log)
+    session.commit()
+    assert maintenance.backfill_digests(session, batch_size=1) == 2
+    first, second = session.query(model.Log).order_by(model.Log.id).all()
+    assert first.text_sha256 == blobstore.digest("foobarbaz")
+    assert first.text_size == 9
+    assert first.patch_sha256 is None
+    assert second.patch_sha256 == blobstore.digest("a patch")
+    assert second.patch_size == 7
+    assert maintenance.backfill_digests(session) == 0
+
+
+def test_backfill_advisories(session):
+    advisories = model.Advisories(repo_id=1, manager="composer")
+    advisories.set_data({
+        "guzzlehttp/psr7": {
+            "version": "1.8.3",
+            "advisories": [{"title": "Oops", "link": "https://example.org", "cve": "CVE-2022-24775"}],
+        },
+    })
+    session.add(advisories)
+    session.commit()
+    assert maintenance.backfill_advisories(session) == 1
+    row = session.query(model.Advisory).one()
+    assert (row.repo_id, row.advisory_id, row.package) == (1, "CVE-2022-24775", "guzzlehttp/psr7")
+
+
+def test_backfill_versions(session):
+    for version in ("^1.2.3", "dev-master"):
+        session.add(model.Dependency(name="foo", version=version, manager="npm", mode="prod", repo_id=1))
+    session.commit()
+    # Pretend these were stored before versions were parsed
+    session.query(model.Dependency).update({"version_major": None, "version_kind": None})
+    session.commit()
+    assert maintenance.backfill_versions(session, batch_size=1) == 2
+    session.expire_all()
+    first, second = session.query(model.Dependency).order_by(model.Dependency.id).all()
+    assert (first.version_kind, first.version_major, first.version_minor) == ("caret", 1, 2)
+    assert (second.version_kind, second.version_major) == ("other", None)
+
+
+def test_retention(session, tmp_path, mocker):
+    mocker.patch("libup.config.private", return_value={"blob_store": str(tmp_path)})
+    mocker.patch("libup.maintenance.time.sleep")
+    # oldest to newest: legacy with patch, legacy without, pushed, not pushed, then 2 recent
+    for is_pushed, patch in ((None, "patch"), (None, None), (True, "pushed"),
+                             (False, "not pushed"), (False, None), (False, None)):
+        log = model.Log(repo_id=1, time="20220218000000")
+        log.set_text("same text")
+        log.set_patch(patch)
+        session.add(log)
+        session.flush()
+        # Set afterwards, so None isn't replaced by the column default
+        log.is_pushed = is_pushed
+    session.commit()
+    store = blobstore.get_store()
+    dry = maintenance.retention(session, keep=2, dry_run=True)
+    # Uncompressed sizes, not the length of the blob references
+    assert dry == {"logs": 2, "bytes": 2 * len("same text") + len("not pushed")}
+    assert session.query(model.Log).filter_by(is_compacted=True).count() == 0
+
+    assert maintenance.retention(session, keep=2, batch_size=1) == dry
+    logs = session.query(model.Log).order_by(model.Log.id).all()
+    assert [log.is_compacted for log in logs] == [False, True, False, True, False, False]
+    compacted = logs[3]
+    assert compacted.get_text() == ""
+    assert compacted.get_patch() is None
+    assert compacted.text_sha256 == blobstore.digest("same text")
+    assert compacted.patch_sha256 == blobstore.digest("not pushed")
+    # Blobs are only deleted by sweep_blobs()
+    assert store.exists(blobstore.digest("not pushed"))
+    # Nothing left to do
+    assert maintenance.retention(session, keep=2)["logs"] == 0
+
+    # Just stored, so within the grace period
+    assert maintenance.sweep_blobs(session, grace=3600) == 0
+    mocker.patch("libup.maintenance.time.time", return_value=time.time() + 7200)
+    assert maintenance.sweep_blobs(session, grace=3600) == 1
+    # The patch blob is gone, the shared text blob isn't
+    assert not store.exists(blobstore.digest("not pushed"))
+    assert store.exists(blobstore.digest("same text"))
+
+    # Running migrate-blobs afterwards leaves compacted logs alone
+    compacted_id = compacted.id
+    assert maintenance.migrate_blobs(session) == 0
+    assert session.get(model.Log, compacted_id).text_sha256 == blobstore.digest("same text")
@@ -14,9 +14,20 @@ GNU Affero General Public License for more details.
 You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
+import io
+import json
 import pytest
+import requests
 
-from libup import metadata
+from libup import httpcache, metadata
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, mocker):
+    """don't touch the real cache"""
+    cache = httpcache.HTTPCache(str(tmp_path / "http.sqlite3"))
+    mocker.patch("libup.httpcache.get_cache", return_value=cache)
+    return cache
 
 
 @pytest.mark.skip(reason="broken")
@@ -29,6 +40,134 @@ def test_composer_metadata():
     metadata.get_composer_metadata("roave/security-advisories")
 
 
+@pytest.mark.parametrize("status,body", (
+    (503, b"Service Unavailable"),
+    (200, b"<html>"),
+    (200, b'{"packages": {}}'),
+))
+def test_composer_metadata_errors(status, body):
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = body
+    with pytest.raises((requests.HTTPError, ValueError)):
+        metadata.parse_composer_metadata("psr/log", resp)
+
+
 def test_cargo_metadata():
     data = metadata.get_cargo_metadata("parsoid")
     assert "Parsoid" in data["description"]
+
+
+def test_rate_limiter(mocker):
+    monotonic = mocker.patch("libup.metadata.time.monotonic", return_value=100.0)
+    sleep = mocker.patch("libup.metadata.time.sleep")
+    limiter = metadata.RateLimiter(4)
+    limiter.wait()
+    sleep.assert_not_called()
+    limiter.wait()
+    limiter.wait()
+    assert [call.args[0] for call in sleep.call_args_list] == [0.25, 0.5]
+    # Enough time passed, no need to wait anymore
+    monotonic.return_value = 101.0
+    limiter.wait()
+    assert sleep.call_count == 2
+
+
+def test_get_many_metadata(mocker):
+    def fake(manager, name, description=True):
+        if name == "broken":
+            raise KeyError("crate")
+        return {"latest": "1.0.0", "description": f"{manager} {name}"}
+
+    mocker.patch("libup.metadata.get_metadata", side_effect=fake)
+    assert metadata.get_many_metadata([("npm", "eslint"), ("cargo", "broken"), ("cargo", "serde")]) == {
+        ("npm", "eslint"): {"latest": "1.0.0", "description": "npm eslint"},
+        ("cargo", "serde"): {"latest": "1.0.0", "description": "cargo serde"},
+    }
+
+
+def test_npm_metadata_cached(mocker):
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.raw = io.BytesIO(b'{"dist-tags": {"latest": "8.9.0"}, "description": "linter"}')
+    get = mocker.patch("libup.httpcache.session.get", return_value=resp)
+    for _ in range(2):
+        assert metadata.get_npm_metadata("eslint") == {"latest": "8.9.0", "description": "linter"}
+    get.assert_called_once()
+
+
+def test_npm_metadata_abbreviated(mocker):
+    resp = requests.Response()
+    resp.status_code = 200
+    # The versions are never read
+    resp.raw = io.BytesIO(b'{"name": "eslint", "dist-tags": {"latest": "8.9.0"}, "versions": {"1.0.0": {')
+    get = mocker.patch("libup.httpcache.session.get", return_value=resp)
+    assert metadata.get_npm_metadata("eslint", description=False) == {"latest": "8.9.0", "description": None}
+    assert get.call_args.kwargs["headers"] == {"Accept": metadata.NPM_ABBREVIATED}
+    assert get.call_args.kwargs["stream"] is True
+
+
+def test_packagist_cursor(tmp_path, mocker):
+    mocker.patch("libup.metadata.PACKAGIST_CURSOR", str(tmp_path / "cache" / "packagist-changes.json"))
+    assert metadata.load_packagist_cursor() == (None, set())
+    metadata.save_packagist_cursor(16449999990000)
+    assert metadata.load_packagist_cursor() == (16449999990000, set())
+    metadata.save_packagist_cursor(16449999990001, {"psr/log"})
+    assert metadata.load_packagist_cursor() == (16449999990001, {"psr/log"})
+
+
+@pytest.mark.parametrize("since,body,expected", (
+    # No cursor yet
+    (None, {"error": "Invalid or missing ?since", "timestamp": 200}, (None, 200)),
+    (100, {"actions": [
+        {"type": "update", "package": "psr/log", "time": 150},
+        {"type": "update", "package": "psr/log~dev", "time": 151},
+        {"type": "delete", "package": "old/package", "time": 160},
+    ], "timestamp": 200}, ({"psr/log", "old/package"}, 200)),
+    # Cursor too old
+    (100, {"actions": [{"type": "resync", "package": "*", "time": 200}], "timestamp": 200}, (None, 200)),
+))
+def test_packagist_changes(mocker, since, body, expected):
+    resp = requests.Response()
+    resp.status_code = 200 if "actions" in body else 400
+    resp._content = json.dumps(body).encode()
+    get = mocker.patch("libup.metadata.session.get", return_value=resp)
+    assert metadata.packagist_changes(since) == expected
+    if since is not None:
+        assert get.call_args.kwargs["params"] == {"since": since}
+
+
+@pytest.mark.parametrize("name,expected", (
+    ("a", "1/a"),
+    ("ab", "2/ab"),
+    ("abc", "3/a/abc"),
+    ("Serde", "se/rd/serde"),
+))
+def test_crates_index_path(name, expected):
+    assert metadata.crates_index_path(name) == expected
+
+
+def test_cargo_metadata_index(mocker):
+    lines = [
+        {"name": "toml", "vers": "0.5.8", "yanked": False},
+        {"name": "toml", "vers": "0.5.10", "yanked": False},
+        {"name": "toml", "vers": "0.5.11", "yanked": True},
+        {"name": "toml", "vers": "0.6.0-alpha.1", "yanked": False},
+    ]
+    resp = requests.Response()
+    resp.status_code = 200
+    resp.raw = io.BytesIO("\n".join(json.dumps(line) for line in lines).encode())
+    get = mocker.patch("libup.httpcache.session.get", return_value=resp)
+    assert metadata.get_cargo_metadata("toml", description=False) == {"latest": "0.5.10", "description": None}
+    assert get.call_args.args[0] == "https://index.crates.io/to/ml/toml"
+
+
+def test_cargo_metadata_index_error(mocker):
+    resp = requests.Response()
+    resp.status_code = 503
+    resp.raw = io.BytesIO(b"")
+    mocker.patch("libup.httpcache.session.get", return_value=resp)
+    with pytest.raises(ValueError, match="toml"):
+        metadata.get_cargo_metadata("toml", description=False)
+    # So it's left out instead of recording 0.0.0
+    assert metadata.get_many_metadata([("cargo", "toml")]) == {}
@@ -16,6 +16,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import pytest
+from sqlalchemy import inspect
 
 from libup.model import Advisories, Log, Repository, Upstream
 from libup.utils import BLOB_SIZE
@@ -33,6 +34,39 @@ def test_log():
     assert log.get_text() == large_text
 
 
+def test_log_digests():
+    log = Log()
+    log.set_text('foobarbaz')
+    assert log.text_sha256 == '97df3588b5a3f24babc3851b372f0ba71a9dcdded43b14b9d06961bfc1707d9d'
+    assert log.text_size == 9
+    assert log.text_digest() == log.text_sha256
+    assert log.patch_digest() is None
+    log.set_patch('ü')
+    assert log.patch_size == 2
+    assert log.patch_digest() == '607474ca475a9724d7360aba71a56d5df77e61350e3f724cfa1f46e857e2d85f'
+    # Older rows without stored digests are hashed on demand
+    log.patch_sha256 = None
+    assert log.patch_digest() == '607474ca475a9724d7360aba71a56d5df77e61350e3f724cfa1f46e857e2d85f'
+
+
+def test_log_blobs_deferred(session):
+    log = Log(time="20220208000000")
+    log.set_text("foobarbaz")
+    log.set_patch("a patch")
+    session.add(log)
+    session.commit()
+    session.expunge_all()
+    log = session.query(Log).first()
+    assert {"text", "patch"} <= inspect(log).unloaded
+    # Accessing one loads the whole group
+    assert log.get_text() == "foobarbaz"
+    assert "patch" not in inspect(log).unloaded
+    assert log.get_patch() == "a patch"
+    session.expunge_all()
+    summary = session.query(Log).options(Log.summary()).first()
+    assert {"text", "patch", "hashtags", "sha1"} <= inspect(summary).unloaded
+
+
 def test_advisories():
     advisories = Advisories()
     data = {'foo': 'bar'}
@@ -17,7 +17,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 import pytest
 
-from libup import plan
+from libup import db, model, plan, versions
 
 
 @pytest.mark.parametrize('current,wanted,expected', (
@@ -41,3 +41,129 @@ from libup import plan
 def test_equals(current, wanted, expected):
     actual = plan.equals(current, wanted)
     assert actual == expected
+
+
+def test_rollout(mocker, session):
+    mocker.patch("libup.config.repositories", return_value={"canaries": []})
+    mocker.patch("libup.config.releases", return_value={
+        "main": {"npm": {"eslint": {"to": "7.1.0"}}},
+    })
+    for i, version in enumerate(["7.0.0", "^7.1.0", "8.0.0", "dev-master"]):
+        repo = model.Repository(name=f"test/{i}", branch="main")
+        repo.dependencies.append(model.Dependency(name="eslint", version=version, manager="npm", mode="dev"))
+        session.add(repo)
+    session.commit()
+    plan_ = plan.Plan("main")
+    assert plan_.rollout(session, "npm", "eslint") == {"total": 4, "updated": 2}
+    assert plan_.rollout(session, "npm", "grunt") is None
+
+
+@pytest.mark.parametrize('wanted', ('7.1.0', '7.1.0-beta.2', 'dev-master'))
+def test_rollout_agrees_with_equals(mocker, wanted, session):
+    mocker.patch("libup.config.repositories", return_value={"canaries": []})
+    mocker.patch("libup.config.releases", return_value={
+        "main": {"npm": {"eslint": {"to": wanted}}},
+    })
+    used = ["7.0.0", "7.1.0-beta.1", "7.1.0-beta.2", "7.1.0-beta.10", "^7.1.0", "~7.1", "7.2.0-rc.1",
+            "file:../eslint", "dev-master", "*"]
+    for i, version in enumerate(used):
+        repo = model.Repository(name=f"test/{i}", branch="main")
+        repo.dependencies.append(model.Dependency(name="eslint", version=version, manager="npm", mode="dev"))
+        session.add(repo)
+    session.commit()
+    rollout = plan.Plan("main").rollout(session, "npm", "eslint")
+    if versions.parse_version(wanted) is None:
+        assert rollout is None
+    else:
+        assert rollout == {"total": len(used), "updated": sum(plan.equals(version, wanted) for version in used)}
+
+
+def test_check_canary_readiness(mocker, monkeypatch, session):
+    monkeypatch.setattr(plan, "_readiness", {})
+    mocker.patch("libup.config.repositories", return_value={"canaries": ["test/canary"]})
+    mocker.patch("libup.config.releases", return_value={
+        "main": {"npm": {"eslint": {"to": "8.0.0", "weight": 5}}},
+    })
+    canary = model.Repository(name="test/canary", branch="main")
+    regular = model.Repository(name="test/regular", branch="main")
+    session.add_all([canary, regular])
+    session.commit()
+    db.sync_dependencies(session, {
+        canary.id: [model.Dependency(name="eslint", version="7.0.0", manager="npm", mode="dev")],
+        regular.id: [model.Dependency(name="eslint", version="7.0.0", manager="npm", mode="dev")],
+    })
+    session.commit()
+    planner = plan.Plan("main")
+    deps = regular.dependencies
+    # Canary still needs the update
+    assert planner.check(session, "test/canary", deps) == [("npm", "eslint", "8.0.0", 5)]
+    assert planner.check(session, "test/regular", deps) == []
+    # Served from the cache now
+    query = mocker.spy(session, "query")
+    assert planner.check(session, "test/regular", deps) == []
+    assert query.call_count == 1
+    # The canary got the update, so the cache is invalidated
+    db.sync_dependencies(session, {
+        canary.id: [model.Dependency(name="eslint", version="8.0.0", manager="npm", mode="dev")],
+    })
+    session.commit()
+    assert planner.check(session, "test/regular", deps) == [("npm", "eslint", "8.0.0", 5)]
+
+
+def test_status(mocker, session):
+    mocker.patch("libup.config.repositories", return_value={"canaries": ["test/canary"]})
+    mocker.patch("libup.config.releases", return_value={
+        "main": {"npm": {"eslint": {"to": "8.0.0"}, "grunt": {"to": "1.5.0"}}},
+    })
+    for name, branch, version in (("test/canary", "main", "8.0.0"), ("test/regular", "main", "7.0.0"),
+                                  ("test/other", "REL1_37", "7.0.0")):
+        repo = model.Repository(name=name, branch=branch)
+        repo.dependencies.append(model.Dependency(name="eslint", version=version, manager="npm", mode="dev"))
+        # Same name, different manager
+        repo.dependencies.append(model.Dependency(name="eslint", version="1.0.0", manager="composer",
+                                                  mode="dev"))
+        session.add(repo)
+    session.commit()
+    query = mocker.spy(session, "query")
+    status = plan.Plan("main").status(session)
+    assert query.call_count == 1
+    eslint = status["npm"]["eslint"]
+    assert eslint["info"] == {"to": "8.0.0"}
+    assert eslint["stats"] == {"canaries": {"total": 1, "percent": 100},
+                               "repositories": {"total": 2, "percent": 50}}
+    assert [repo.name for repo in eslint["canaries"]["updated"]] == ["test/canary"]
+    assert eslint["canaries"]["missing"] == []
+    assert [repo.name for repo in eslint["repositories"]["missing"]] == ["test/regular"]
+    # Nothing uses it, which counts as done
+    assert status["npm"]["grunt"]["stats"]["repositories"] == {"total": 0, "percent": 100}
+
+
+def test_check_many(mocker, monkeypatch, session):
+    monkeypatch.setattr(plan, "_readiness", {})
+    mocker.patch("libup.config.repositories", return_value={"canaries": ["test/canary"]})
+    mocker.patch("libup.config.releases", return_value={
+        "main": {"npm": {"eslint": {"to": "8.0.0", "weight": 5}}},
+    })
+    for name, branch, version in (("test/canary", "main", "7.0.0"), ("test/regular", "main", "7.0.0"),
+                                  ("test/updated", "main", "8.0.0"), ("test/other", "REL1_37", "7.0.0")):
+        repo = model.Repository(name=name, branch=branch)
+        repo.dependencies.append(model.Dependency(name="eslint", version=version, manager="npm", mode="dev"))
+        repo.dependencies.append(model.Dependency(name="grunt", version="1.0.0", manager="npm", mode="dev"))
+        session.add(repo)
+    session.add(model.Repository(name="test/empty", branch="main"))
+    session.commit()
+    planner = plan.Plan("main")
+    query = mocker.spy(session, "query")
+    plans = planner.check_many(session)
+    # Tracked dependencies, then canary readiness's two
+    assert query.call_count == 3
+    assert plans == {
+        "test/canary": [("npm", "eslint", "8.0.0", 5)],
+        # Waiting on the canary
+        "test/regular": [],
+        "test/updated": [],
+        "test/empty": [],
+    }
+    assert planner.check_many(session, ["test/canary", "test/missing"]) == {
+        "test/canary": [("npm", "eslint", "8.0.0", 5)],
+    }
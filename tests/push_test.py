@@ -15,6 +15,7 @@ You should have received a copy of the GNU Affero General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+from libup import model
 from libup.push import Pusher
 
 
@@ -57,3 +58,17 @@ def test_build_push_command():
         'ssh://libraryupgrader@gerrit.wikimedia.org:29418/test/example',
         'HEAD:refs/for/REL1_35%topic=bump-dev-deps,t=CVE-2000-1234,m=View+logs'
     ] == pusher.build_push_command(options)
+
+
+def test_is_latest(session):
+    repo = model.Repository(name="test/example", branch="main")
+    session.add(repo)
+    for _ in range(2):
+        log = model.Log(time="20220208000000")
+        log.set_text("foobarbaz")
+        repo.logs.append(log)
+    session.commit()
+    first, second = sorted(repo.logs)
+    pusher = Pusher()
+    assert pusher.is_latest(second, repo) is True
+    assert pusher.is_latest(first, repo) is False
@@ -0,0 +1,127 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+
+import pytest
+from sqlalchemy import event
+
+from libup import model, plan, web
+
+# A full table scan, as opposed to "SCAN foo USING (COVERING) INDEX ..."
+FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+ENDPOINTS = [
+    "/",
+    "/r",
+    "/r/test/ok",
+    "/logs2/1",
+    "/errors",
+    "/library",
+    "/library/npm/eslint-config-wikimedia",
+    "/library_table?r=npm:eslint-config-wikimedia,composer:mediawiki/mediawiki-codesniffer",
+    "/vulns/npm",
+    "/vulns/composer",
+    "/status",
+    "/simulate",
+    "/plan.json?repository=test/ok&branch=main",
+    "/plan_batch.json?branch=main",
+    "/plan_batch.json?branch=main&repository=test/ok&repository=test/canary",
+    "/metrics",
+]
+
+
+@pytest.fixture
+def statements():
+    web.app.config['TESTING'] = True
+    web.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    with web.app.app_context():
+        engine = web.db.engine
+        # Other tests share the in-memory database, start from scratch
+        model.Base.metadata.drop_all(engine)
+        model.Base.metadata.create_all(engine)
+        session = web.db.session
+        session.add_all([
+            model.Repository(id=1, name="test/canary", branch="main", is_canary=True),
+            model.Repository(id=2, name="test/ok", branch="main"),
+            model.Dependency(repo_id=1, name="eslint-config-wikimedia", version="0.22.1", manager="npm", mode="dev"),
+            model.Dependency(repo_id=2, name="eslint-config-wikimedia", version="0.20.0", manager="npm", mode="dev"),
+            model.Dependency(repo_id=2, name="mediawiki/mediawiki-codesniffer", version="37.0.0",
+                             manager="composer", mode="dev"),
+            model.Upstream(manager="npm", name="eslint-config-wikimedia", description=b"", latest="0.22.1"),
+        ])
+        log = model.Log(repo_id=2, time="20220207181240", is_error=False)
+        log.set_text("foobarbaz")
+        session.add(log)
+        for manager in ("npm", "composer"):
+            advisories = model.Advisories(repo_id=2, manager=manager)
+            advisories.set_data({})
+            session.add(advisories)
+            advisory = model.Advisory(repo_id=2, manager=manager, advisory_id="CVE-2022-0001",
+                                      package="foo", severity="high")
+            advisory.set_info({"source": "CVE-2022-0001", "name": "foo", "severity": "high", "title": "Oops"})
+            session.add(advisory)
+        session.commit()
+
+        captured = []
+
+        def capture(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith("SELECT"):
+                captured.append((statement, parameters))
+
+        event.listen(engine, "before_cursor_execute", capture)
+        yield captured
+        event.remove(engine, "before_cursor_execute", capture)
+        session.remove()
+        model.Base.metadata.drop_all(engine)
+
+
+def full_scans(statements) -> list:
+    """full scans of real tables (not subqueries) in the given statements"""
+    scans = []
+    with web.db.engine.connect() as conn:
+        for statement, parameters in statements:
+            details = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+            sorted_in_memory = any("TEMP B-TREE" in detail for detail in details)
+            for detail in details:
+                match = FULL_SCAN.match(detail)
+                if not match or match.group(1) not in model.Base.metadata.tables:
+                    continue
+                table = match.group(1)
+                if not sorted_in_memory and re.search(rf"ORDER BY {table}\.id( DESC)?\s+LIMIT", statement):
+                    # Walking the primary key in order and stopping early, e.g. the N most recent logs
+                    continue
+                scans.append((table, statement))
+    return scans
+
+
+def test_web_queries_use_indexes(statements):
+    with web.app.test_client() as client:
+        for endpoint in ENDPOINTS:
+            rv = client.get(endpoint)
+            assert rv.status_code == 200, endpoint
+    assert statements
+    assert full_scans(statements) == []
+
+
+def test_plan_queries_use_indexes(statements):
+    with web.app.app_context():
+        planner = plan.Plan("main")
+        planner.status(web.db.session)
+        repo = web.db.session.query(model.Repository).filter_by(name="test/ok").first()
+        planner.check(web.db.session, repo.name, repo.dependencies)
+    assert statements
+    assert full_scans(statements) == []
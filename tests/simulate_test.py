@@ -0,0 +1,80 @@
+"""
+Copyright (C) 2022 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import pytest
+
+from libup import model, simulate
+
+RELEASES = {
+    "version": 2,
+    "push": True,
+    "main": {"npm": {"eslint": {"to": "8.0.0", "weight": 5}}},
+}
+
+
+def test_parse_releases():
+    assert simulate.parse_releases('{"version": 2, "push": false, "main": {}}') == \
+        {"version": 2, "push": False, "main": {}}
+    with pytest.raises(ValueError, match="Invalid JSON"):
+        simulate.parse_releases('{')
+    with pytest.raises(ValueError, match="version 2"):
+        simulate.parse_releases('{"version": 1}')
+    with pytest.raises(ValueError, match='main: npm: eslint is missing "weight"'):
+        simulate.parse_releases('{"version": 2, "main": {"npm": {"eslint": {"to": "8.0.0"}}}}')
+    with pytest.raises(ValueError, match="main: expected an object"):
+        simulate.parse_releases('{"version": 2, "main": []}')
+    with pytest.raises(ValueError, match="main: npm: expected an object"):
+        simulate.parse_releases('{"version": 2, "main": {"npm": ["eslint"]}}')
+    with pytest.raises(ValueError, match="main: npm: eslint: expected an object"):
+        simulate.parse_releases('{"version": 2, "main": {"npm": {"eslint": "8.0.0"}}}')
+    with pytest.raises(ValueError, match='main: npm: eslint: "to" must be a string'):
+        simulate.parse_releases('{"version": 2, "main": {"npm": {"eslint": {"to": 8, "weight": 5}}}}')
+    with pytest.raises(ValueError, match='main: npm: eslint: "weight" must be an integer'):
+        simulate.parse_releases('{"version": 2, "main": {"npm": {"eslint": {"to": "8.0.0", "weight": "5"}}}}')
+    with pytest.raises(ValueError, match='main: npm: eslint: "weight" must be an integer'):
+        simulate.parse_releases('{"version": 2, "main": {"npm": {"eslint": {"to": "8.0.0", "weight": true}}}}')
+
+
+def test_simulate(mocker, session):
+    mocker.patch("libup.config.repositories", return_value={"canaries": ["test/canary"]})
+    mocker.patch("libup.config.releases", return_value=RELEASES)
+    for name, eslint, grunt in (("test/canary", "8.0.0", "1.0.0"), ("test/regular", "7.0.0", "1.0.0"),
+                                ("test/new", "8.0.0", "1.5.0")):
+        repo = model.Repository(name=name, branch="main")
+        repo.dependencies.append(model.Dependency(name="eslint", version=eslint, manager="npm", mode="dev"))
+        repo.dependencies.append(model.Dependency(name="grunt", version=grunt, manager="npm", mode="dev"))
+        session.add(repo)
+    session.commit()
+    candidate = {**RELEASES, "main": {"npm": {
+        "eslint": {"to": "8.0.0", "weight": 5},
+        "grunt": {"to": "1.5.0", "weight": 5},
+    }}}
+    result = simulate.simulate(session, "main", candidate)
+    # Even though the canary hasn't been updated
+    assert result["current"] == {
+        "affected": 1,
+        "patches": 0,
+        "weight": 5,
+        "repositories": {
+            "test/regular": {"updates": [("npm", "eslint", "8.0.0", 5)], "weight": 5, "push": False},
+        },
+    }
+    candidate = result["candidate"]
+    assert (candidate["affected"], candidate["patches"], candidate["weight"]) == (2, 1, 15)
+    assert candidate["repositories"]["test/regular"]["push"] is True
+    assert result["changed"] == ["test/canary", "test/regular"]
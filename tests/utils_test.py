@@ -16,6 +16,7 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import os
+import pytest
 
 from libup import utils
 
@@ -63,3 +64,39 @@ def test_compress_helpers():
     # internal encoding detail
     assert encoded.startswith(b'l:')
     assert utils.maybe_decompress(encoded) == large_text
+
+
+def sample_logs():
+    for i in range(500):
+        yield (f"$ npm install\nnpm WARN deprecated request@2.88.{i}: request has been deprecated\n"
+               f"added {i} packages from {i * 3} contributors and audited {i * 7} packages in {i % 13}.5s\n"
+               f"found {i % 4} vulnerabilities\n").encode()
+
+
+@pytest.fixture
+def zstd_dir(tmp_path, monkeypatch):
+    pytest.importorskip("zstandard")
+    monkeypatch.setattr(utils, "ZSTD_DICTIONARIES", str(tmp_path))
+    utils.current_zstd_dictionary_id.cache_clear()
+    yield tmp_path
+    utils.current_zstd_dictionary_id.cache_clear()
+
+
+def test_zstd_codec(zstd_dir):
+    # No dictionary trained yet
+    assert utils.maybe_compress('foobarbaz') == b'foobarbaz'
+    dictionary = utils.zstandard.train_dictionary(16384, list(sample_logs()))
+    dict_id = utils.save_zstd_dictionary(dictionary)
+    assert (zstd_dir / 'CURRENT').read_text() == f"{dict_id}\n"
+    text = "$ npm install\nnpm WARN deprecated request@2.88.2: request has been deprecated\n"
+    encoded = utils.maybe_compress(text)
+    # Used for short texts too
+    assert encoded.startswith(utils.ZSTD_PREFIX)
+    assert len(encoded) < len(text)
+    assert utils.maybe_decompress(encoded) == text
+    # Old formats are still readable
+    assert utils.maybe_decompress(utils.compress(text, b'l:')) == text
+    assert utils.maybe_decompress(utils.compress(text, b'g:')) == text
+    assert utils.maybe_decompress(text.encode()) == text
+    # Including uncompressed text that happens to look like a prefix
+    assert utils.maybe_decompress(b'z: not compressed') == 'z: not compressed'
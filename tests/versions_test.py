@@ -0,0 +1,104 @@
+"""
+Copyright (C) 2020 Kunal Mehta <legoktm@debian.org>
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+
+import pytest
+
+from libup import versions
+from libup.versions import Version
+
+
+@pytest.mark.parametrize('text,expected', (
+    ('1.2.3', Version(1, 2, 3)),
+    ('v1.2', Version(1, 2, 0)),
+    ('1', Version(1, 0, 0)),
+    ('1.0.0-beta.2', Version(1, 0, 0, ('beta', '2'))),
+    ('1.2.3+build.5', Version(1, 2, 3)),
+    ('1.2.3.4', Version(1, 2, 3)),
+    ('dev-master', None),
+))
+def test_parse_version(text, expected):
+    assert versions.parse_version(text) == expected
+
+
+@pytest.mark.parametrize('text,kind,minimum', (
+    ('1.2.3', 'exact', Version(1, 2, 3)),
+    ('^1.2', 'caret', Version(1, 2, 0)),
+    ('~0.5.1', 'tilde', Version(0, 5, 1)),
+    ('~> 2.1', 'tilde', Version(2, 1, 0)),
+    ('1.x', 'wildcard', Version(1, 0, 0)),
+    ('*', 'wildcard', Version(0, 0, 0)),
+    ('>=1.0 <2.0', 'range', Version(1, 0, 0)),
+    ('>=1.0,<2.0', 'range', Version(1, 0, 0)),
+    ('>= 1.2.3', 'range', Version(1, 2, 3)),
+    ('<2.0', 'range', Version(0, 0, 0)),
+    ('1.0 - 2.0', 'range', Version(1, 0, 0)),
+    ('^2 || ^1', 'alternatives', Version(1, 0, 0)),
+    ('^1.0|^2.0', 'alternatives', Version(1, 0, 0)),
+    ('1.0.0@dev', 'exact', Version(1, 0, 0)),
+    ('dev-master', 'other', None),
+    ('file:tests/foo', 'other', None),
+    ('^1 || dev-master', 'other', None),
+))
+def test_parse_constraint(text, kind, minimum):
+    assert versions.parse_constraint(text) == (kind, minimum)
+
+
+def test_sort_key():
+    ordered = ['1.0.0-alpha', '1.0.0-alpha.1', '1.0.0-alpha.beta', '1.0.0-beta.2',
+               '1.0.0-beta.11', '1.0.0', '1.0.1', '1.10.0']
+    parsed = [versions.parse_version(text) for text in reversed(ordered)]
+    assert sorted(parsed, key=Version.sort_key) == [versions.parse_version(text) for text in ordered]
+
+
+def test_columns():
+    assert versions.columns('^1.2.3-rc.1') == {
+        'version_kind': 'caret',
+        'version_major': 1,
+        'version_minor': 2,
+        'version_patch': 3,
+        'version_prerelease': True,
+    }
+    assert versions.columns('dev-master')['version_major'] is None
+    assert set(versions.columns('1.0.0')) == set(versions.COLUMNS)
+
+
+@pytest.mark.parametrize('current,wanted,expected', (
+    ('2.0', '1.5.0', True),
+    ('1.0.0-rc.1', '1.0.0', False),
+    ('1.0.0', '1.0.0-rc.1', True),
+    # The lowest alternative is too old
+    ('^1.0 | ^2.0', '1.5.0', False),
+    ('^1.0 || ^2.0', '1.0.0', True),
+    ('>=1.5.0 <2.0.0', '1.5.0', True),
+    ('^2.0, <3.0', '2.1.0', False),
+    ('dev-master', '1.0.0', False),
+    ('*', '1.0.0', False),
+    ('dev-master', 'dev-master', True),
+))
+def test_at_least(current, wanted, expected):
+    assert versions.at_least(current, wanted) == expected
+
+
+def test_at_least_many():
+    assert versions.at_least_many(['1.0.0', '^1.2.0', '1.0.0', 'file:foo', 'dev-master'], '1.1.0') == {
+        '1.0.0': False,
+        '^1.2.0': True,
+        'file:foo': True,
+        'dev-master': False,
+    }
+    assert versions.at_least_many(['1.0.0', '^1 || ^2'], '^1 || ^2') == {'1.0.0': False, '^1 || ^2': True}
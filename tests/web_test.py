@@ -35,6 +35,10 @@ def client():
     log = model.Log(repo_id=2, time='20210419042355', is_error=True)
     log.set_text("foobarbaz")
     web.db.session.add(log)
+    advisory = model.Advisory(repo_id=2, manager='npm', advisory_id='1179', package='minimist', severity='critical')
+    advisory.set_info({'source': 1179, 'name': 'minimist', 'severity': 'critical',
+                       'title': 'Prototype Pollution', 'url': 'https://github.com/advisories/GHSA-vh95-rmgr-6w4m'})
+    web.db.session.add(advisory)
 
     with web.app.test_client() as client:
         yield client
@@ -77,3 +81,78 @@ def test_r_index(client):
 def test_credits_(client):
     rv = client.get('/credits')
     assert 'thank you' in rv.data.decode()
+
+
+def test_vulns_npm(client):
+    rv = client.get('/vulns/npm')
+    assert 'There are 1 npm security advisories' in rv.data.decode()
+    assert '#1179: minimist' in rv.data.decode()
+    assert 'test/ok' in rv.data.decode()
+    rv = client.get('/vulns/composer')
+    assert 'There are 0 composer security advisories' in rv.data.decode()
+
+
+@pytest.fixture
+def replica(client, monkeypatch):
+    monkeypatch.setitem(web.app.config, 'SQLALCHEMY_BINDS', {web.REPLICA: 'sqlite://'})
+    monkeypatch.setattr(web, '_replica_status', {'checked': 0.0, 'fresh': False})
+    engine = web.db.get_engine(web.app, bind=web.REPLICA)
+    model.Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(model.Log.__table__.delete())
+        conn.execute(model.Repository.__table__.delete())
+        conn.execute(model.Repository.__table__.insert(), [
+            {'id': 2, 'name': 'test/replica', 'branch': 'main', 'is_error': True, 'is_bundled': False,
+             'is_wm_deployed': False, 'is_canary': False},
+        ])
+    # Commit the primary's seed data, the staleness check reads it
+    web.db.session.commit()
+    yield engine
+
+
+def add_replica_log(engine, time):
+    with engine.begin() as conn:
+        conn.execute(model.Log.__table__.insert(), [
+            {'repo_id': 2, 'time': time, 'text': b'', 'duration': 0, 'is_error': False, 'is_compacted': False},
+        ])
+
+
+def test_replica(replica):
+    with web.app.test_client() as client:
+        add_replica_log(replica, '20210419042355')
+        rv = client.get('/errors')
+        assert 'test/replica' in rv.data.decode()
+        assert 'test/errors' not in rv.data.decode()
+    with web.app.test_request_context('/plan.json', method='POST'):
+        assert web.use_replica() is False
+
+
+def test_replica_stale(replica):
+    with web.app.test_client() as client:
+        # An hour behind the primary
+        add_replica_log(replica, '20210419032355')
+        rv = client.get('/errors')
+        assert 'test/errors' in rv.data.decode()
+        assert 'test/replica' not in rv.data.decode()
+
+
+def test_plan_batch_json(client, mocker):
+    mocker.patch('libup.config.branches', return_value=['main'])
+    rv = client.get('/plan_batch.json?branch=main')
+    assert rv.json == {'status': 'ok', 'plans': {'test/errors': [], 'test/ok': [], 'test/master': []}}
+    rv = client.get('/plan_batch.json?branch=master&repository=test/ok&repository=test/missing')
+    assert rv.json == {'status': 'ok', 'plans': {'test/ok': []}}
+    rv = client.get('/plan_batch.json')
+    assert rv.json['status'] == 'error'
+    rv = client.get('/plan_batch.json?branch=REL1_00')
+    assert rv.json['status'] == 'error'
+
+
+def test_simulate(client, mocker):
+    mocker.patch('libup.config.releases', return_value={'version': 2, 'push': True, 'main': {}})
+    rv = client.get('/simulate')
+    assert '&#34;version&#34;: 2' in rv.data.decode()
+    rv = client.post('/simulate', data={'releases': '{"version": 2, "main": {"npm": {"eslint": {"to": "8.0.0"}}}}'})
+    assert 'is missing &#34;weight&#34;' in rv.data.decode()
+    rv = client.post('/simulate', data={'releases': '{"version": 2, "main": {}}'})
+    assert '0 repositories would get a different plan' in rv.data.decode()